@@ -1,13 +1,27 @@
-import copy
 import math
 import random
+import sys
+from collections import OrderedDict
 import game
+import bitboard
+import heuristic_table
+import expectimax
+import ntuple
 from constants import *
 
 """
-	used by all 2048 trees to call get_successors
+	used by all 2048 trees to call successor. Boards are immutable (tuples of
+	row tuples, or packed integers with BITBOARD) and are never copied.
 """
-game = game.TwentyFortyEight(4,4)
+if BITBOARD:
+	game = bitboard.Bitboard(SCORING)
+else:
+	game = game.TwentyFortyEight(4, 4, SCORING)
+
+INFINITY = float("inf")
+
+# Move preference of the corner rollout policy, as in main.corner_play
+CORNER_ORDER = [UP, LEFT, RIGHT, DOWN]
 
 def zerolog(x):
 	if x <= 0:
@@ -15,7 +29,10 @@ def zerolog(x):
 	else:
 		return math.log(x,2) 
 
-def heuristic(grid):
+"""
+	heuristic() before scaling by HEURISTICCONSTANT
+"""
+def unscaled_heuristic(grid):
 	score = 0
 	for corner in ["top-left","top-right","bottom-left","bottom-right"]:
 		corner_score = 0
@@ -62,29 +79,236 @@ def heuristic(grid):
 
 		score = max([corner_score,score])
 
-	score = score * HEURISTICCONSTANT
+	return score
+
+def heuristic(grid):
+	score = unscaled_heuristic(grid) * HEURISTICCONSTANT
 	# print "heuristic called: " + str(score)
 	return score
 
 
+"""
+	heuristic() of a board of the search engine, evaluated with the
+	precomputed tables of heuristic_table.py (same value, a few lookups) on
+	4x4 boards, or the n-tuple network's value of the board with
+	NTUPLEHEURISTIC
+"""
+def board_heuristic(state):
+	if NTUPLEHEURISTIC:
+		return ntuple_evaluate(state)
+	if BITBOARD:
+		return heuristic_table.evaluate(state)
+	if len(state) != 4 or len(state[0]) != 4:
+		return heuristic(state)
+	return heuristic_table.evaluate_grid(state)
+
+"""
+	Rollout evaluator "heuristic": board_heuristic() without the
+	HEURISTICCONSTANT weight, which is the heuristic's weight in UCB and 0 by
+	default
+"""
+def heuristic_evaluate(state):
+	if NTUPLEHEURISTIC:
+		return ntuple_evaluate(state)
+	if BITBOARD:
+		return heuristic_table.evaluate_unscaled(state)
+	if len(state) != 4 or len(state[0]) != 4:
+		return unscaled_heuristic(state)
+	return heuristic_table.evaluate_unscaled(bitboard.from_grid(state))
+
+"""
+	expectimax's table-driven evaluator of a board of the search engine
+"""
+def table_evaluate(state):
+	if not BITBOARD:
+		state = bitboard.from_grid(state)
+	return expectimax.evaluate(state)
+
+"""
+	Value of a board of the search engine by the n-tuple network of
+	NTUPLEWEIGHTS (see ntuple.py)
+"""
+def ntuple_evaluate(state):
+	if not BITBOARD:
+		state = bitboard.from_grid(state)
+	return ntuple.default().evaluate(state)
+
+def zero_evaluate(state):
+	return 0
+
+"""
+	Evaluators of the board reached by a truncated rollout, by name. The
+	rollout's value is its score plus the evaluation. Add evaluators with
+	registerEvaluator.
+"""
+EVALUATORS = {"heuristic": heuristic_evaluate,
+	"table": table_evaluate,
+	"ntuple": ntuple_evaluate,
+	"none": zero_evaluate}
+
+def registerEvaluator(name, evaluator):
+	EVALUATORS[name] = evaluator
+
+def setRolloutEvaluator(name):
+	global rolloutEvaluator
+	if name not in EVALUATORS:
+		raise ValueError("unknown rollout evaluator: " + str(name))
+	rolloutEvaluator = EVALUATORS[name]
+
+setRolloutEvaluator(ROLLOUTEVALUATOR)
+
+"""
+	Sets the number of moves of truncated rollouts (None plays to the end)
+"""
+def setRolloutDepth(depth):
+	global ROLLOUTDEPTH
+	ROLLOUTDEPTH = depth
+
+
+
+"""
+	Whose turn it is in a position, part of the transposition table key: the
+	player's (a board after a spawn) or the random tile's (an afterstate)
+"""
+PLAYER = 0
+CHANCE = 1
+
+"""
+	Transposition table for the search. Maps a position to the tree node that
+	holds its statistics, so the same board reached through different move
+	orders is expanded, simulated and backpropagated through a single node.
+
+	The key is the board and whose turn it is (PLAYER or CHANCE). The move
+	that leads to a node is kept by its parent (see Tree.childMoves), so a
+	node can be shared by parents that reach it with different moves. With
+	SYMMETRY, boards are keyed by their canonical board, so the eight
+	symmetric images of a board share one node; that node's state is
+	whichever image was stored first.
+
+	The table holds at most `capacity` nodes and evicts the least recently
+	used one, approximately: a hit only marks its entry as referenced, and
+	when the table is full, referenced entries at the front are moved to
+	the back (their mark cleared) until an unreferenced one is found and
+	evicted. An evicted node stays in the tree, it just stops being shared.
+"""
+class TranspositionTable:
+	def __init__(self, capacity=TTSIZE):
+		self.capacity = capacity
+		self.nodes = OrderedDict()
+		self.referenced = set() # keys hit since they were last moved to the back
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def key(self, state, turn):
+		if isinstance(state, list):
+			state = tuple(tuple(row) for row in state)
+		if SYMMETRY:
+			state = game.canonical(state)[0]
+		return (state, turn)
+
+	"""
+		Returns the node stored for `state` with `turn` to move, or None
+	"""
+	def lookup(self, state, turn):
+		key = self.key(state, turn)
+		node = self.nodes.get(key)
+		if node is None:
+			self.misses += 1
+		else:
+			self.referenced.add(key)
+			self.hits += 1
+		return node
+
+	def store(self, state, turn, node):
+		self.nodes[self.key(state, turn)] = node
+		if len(self.nodes) > self.capacity:
+			self.evict()
+
+	"""
+		Evicts the oldest entry not referenced since it was last moved to the
+		back, giving the referenced ones a second chance
+	"""
+	def evict(self):
+		while True:
+			key, node = self.nodes.popitem(last=False)
+			if key not in self.referenced:
+				self.evictions += 1
+				return
+			self.referenced.discard(key)
+			self.nodes[key] = node
+
+	def hitRate(self):
+		lookups = self.hits + self.misses
+		if lookups == 0:
+			return 0.0
+		return float(self.hits) / lookups
+
+	"""
+		Approximate number of bytes held by the table without the stored
+		nodes: its dicts, the links ordering the entries, and the keys (with
+		their boards when these are not the nodes' own).
+	"""
+	def tableFootprint(self):
+		total = sys.getsizeof(self.nodes) + sys.getsizeof(self.referenced)
+		links = getattr(self.nodes, "_OrderedDict__map", None)
+		if links is not None:
+			total += sys.getsizeof(links) + sum(sys.getsizeof(link) for link in links.itervalues())
+		for key, node in self.nodes.iteritems():
+			total += sys.getsizeof(key)
+			if key[0] is not node.state:
+				total += stateFootprint(key[0])
+		return total
+
+	"""
+		Approximate number of bytes held by the table: tableFootprint and
+		the stored nodes (see nodeFootprint).
+	"""
+	def memoryFootprint(self):
+		return self.tableFootprint() + sum(nodeFootprint(node) for node in self.nodes.itervalues())
+
+	def report(self):
+		return ("transposition table: " + str(len(self.nodes)) + " nodes, hit rate " +
+			str(round(self.hitRate(), 3)) + ", " + str(self.evictions) + " evictions, ~" +
+			str(self.memoryFootprint() / 1024) + " KiB")
+
+
 
 """
 	Parent class for a game tree with the information necessary for MCTS
-	at each node. Each child node is itself another Tree instance in the tree.
-	The root node should be the only one with getLastMove = None.
+	at each node. Each child node is itself another Tree instance in the tree,
+	and its parent keeps the move that leads to it in childMoves (a child
+	shared through the transposition table may be reached by other moves
+	from other parents).
 
 	The methods `select`, `expand` and `simulate` are left
 	should be defined in inheriting classes according to the tree policy,
 	expansion policy, and default simulation policy you'd like.
 
 	input: a game-state `state` i.e. a 2048 board object
+
+	Nodes use __slots__ rather than a per-instance __dict__ to keep large
+	trees small, so every attribute must be listed in the class's __slots__.
 """
-class Tree:
+class Tree(object):
+
+	__slots__ = ("state", "score", "value", "numSimulations", "expandedChildren",
+		"childMoves", "lastMove", "expanded", "untried", "rolloutLength")
+
+	allocated = 0 # number of nodes ever created, read by the search profiler
+	chanceAllocated = 0 # of which chance nodes
+
+	# while True, chance nodes only draw spawns they already have, so that
+	# selection allocates no node; set by main.search once its TREEMEMORY
+	# cap is reached
+	frozen = False
+
 	def __init__(self, state, lastMove=None, score=0):
+		Tree.allocated += 1
 		
 		self.state = state # game state
 		
-		self.score = 0 # score within game state
+		self.score = score # score within game state
 
 		self.value = 0 # sum of values of all the simulations played through this node
 		
@@ -92,17 +316,15 @@ class Tree:
 
 		self.expandedChildren = [] # children of this node that have been expanded, type: Tree list
 
-		self.lastMove = lastMove # move that got us to this state
+		self.childMoves = [] # move leading to each of expandedChildren
+
+		self.lastMove = lastMove # move that first got us to this state
 
 		self.expanded = False
 
-		actions_left = []
-		for direction in [UP,DOWN,LEFT,RIGHT]:
-			successor,_ = game.get_successor(direction, copy.deepcopy(self.state), 0)
-			if successor != None:
-				actions_left.append(direction)
-		
-		self.actions_left = actions_left
+		self.untried = None # legal moves without a child yet, computed on first need by getUntried()
+
+		self.rolloutLength = 0 # moves played by this node's last simulate()
 
 		# self.maxValue = 0 # attempted to use maximum simulation result as indicator of state value... didn't work well
 
@@ -136,13 +358,24 @@ class Tree:
 
 
 	"""
-		Adds `score` to value of all nodes in `path`
+		Adds `score` to value of all nodes in `path`, as the total of
+		`count` simulations
 	"""
-	def backPropagate(self,score,path):
+	def backPropagate(self,score,path,count=1):
 		for node in path:
-			node.incNumSimulations()
+			node.numSimulations += count
 			node.addValue(score)
 
+	"""
+		Virtual loss for tree parallelization: counts `loss` simulations of
+		value 0 through every node of `path`, so other workers selecting
+		meanwhile see lower values and explore elsewhere. Reverted with a
+		negative `loss` before the real result is backpropagated.
+	"""
+	def addVirtualLoss(self,loss,path):
+		for node in path:
+			node.numSimulations += loss
+
 	"""
 		Returns the best move, the move that leads to the child state with
 		the highest average value.
@@ -150,11 +383,12 @@ class Tree:
 	def evaluate(self):
 		bestVal = -1
 		bestNode = None
-		for child in self.expandedChildren:
+		for child, move in zip(self.expandedChildren, self.childMoves):
 			thisVal = child.getValue() # max child
 			# thisVal = child.numSimulations # most robust child
 			if (thisVal > bestVal) or (thisVal == bestVal and random.random() >= 0.5):
 				bestNode = child
+				bestMove = move
 				bestVal = thisVal
 
 		if bestNode == None:
@@ -162,7 +396,6 @@ class Tree:
 			return random.choice([UP, DOWN, LEFT, RIGHT])
 		else:
 			# moves = ["up", "down","left","right"]
-			bestMove = bestNode.getLastMove() 
 			# print "non random move: " + str(moves[bestMove - 1])
 			return bestMove
 
@@ -197,9 +430,6 @@ class Tree:
 		else: 
 			return self.value / self.numSimulations
 
-	"""
-		Called by evaluate()
-	"""
 	def getLastMove(self):
 		return self.lastMove
 
@@ -209,8 +439,180 @@ class Tree:
 	def getExpandedChildren(self):
 		return self.expandedChildren
 
+	"""
+		Called by evaluate(): the move leading to each expanded child
+	"""
+	def getChildMoves(self):
+		return self.childMoves
+
+	def addChild(self, child, move):
+		self.expandedChildren.append(child)
+		self.childMoves.append(move)
+
 	def expandable(self):
-		return (not (self.actions_left == []))
+		return self.getUntried() != []
+
+	"""
+		Legal moves that have not been expanded yet, computed on first need
+		with the engine's cheap can-move check rather than by generating
+		successors. Expansion removes moves from this list, so a node stops
+		being expandable once every move has a child and selection descends
+		below it.
+	"""
+	def getUntried(self):
+		if self.untried is None:
+			self.untried = list(game.legal_moves(self.state) or [])
+		return self.untried
+
+
+
+"""
+	Approximate number of bytes used by a board: a packed integer, or a tuple
+	of row tuples
+"""
+def stateFootprint(state):
+	total = sys.getsizeof(state)
+	if isinstance(state, tuple):
+		total += sum(sys.getsizeof(row) for row in state)
+	return total
+
+# the most a node's untried moves take once computed
+UNTRIEDBYTES = sys.getsizeof(list((UP, DOWN, LEFT, RIGHT)))
+
+"""
+	Approximate number of bytes used by `node`: the node itself, its lists of
+	children and moves, its untried moves (counted at UNTRIEDBYTES until they
+	are computed), its board and the numbers it keeps. Children are not
+	included.
+"""
+def nodeFootprint(node):
+	total = sys.getsizeof(node) + sys.getsizeof(node.expandedChildren) + sys.getsizeof(node.childMoves)
+	if node.untried is None:
+		total += UNTRIEDBYTES
+	else:
+		total += sys.getsizeof(node.untried)
+	total += stateFootprint(node.state)
+	total += sys.getsizeof(node.value) + sys.getsizeof(node.score) + sys.getsizeof(node.heuristic_value)
+	if isinstance(node, ChanceNode):
+		total += sys.getsizeof(node.outcomes) + sys.getsizeof(node.probabilities)
+	return total
+
+"""
+	Nodes of the tree under `root`, each once
+"""
+def treeNodes(root):
+	seen = set()
+	nodes = []
+	stack = [root]
+	while stack:
+		node = stack.pop()
+		if id(node) in seen:
+			continue
+		seen.add(id(node))
+		nodes.append(node)
+		stack.extend(node.getExpandedChildren())
+	return nodes
+
+"""
+	Average nodeFootprint over the tree under `root`
+"""
+def bytesPerNode(root):
+	nodes = treeNodes(root)
+	return float(sum(nodeFootprint(node) for node in nodes)) / len(nodes)
+
+"""
+	Estimate of the memory taken by the tree under `root` and its
+	transposition table while a search grows them, checked against `limit`
+	bytes by full(). measure() adds up nodeFootprint over the tree and
+	TranspositionTable.tableFootprint; the player and chance nodes allocated
+	since (counted by Tree.allocated and Tree.chanceAllocated) are then each
+	counted at the average footprint of their kind in the measured tree, and
+	new table entries at the measured bytes per entry.
+
+	Nodes grow as they get children, so the tree is measured again whenever
+	it may have doubled, or the estimate has covered half of the memory that
+	was left at the last measurement.
+"""
+class TreeMemory:
+	def __init__(self, root, limit):
+		self.root = root
+		self.limit = limit
+		self.measure()
+		self.last = self.measured
+		# until the search has grown, an iteration is taken to add a chance
+		# node and a player node
+		self.step = self.playerBytes + self.chanceBytes
+
+	def measure(self):
+		footprints = ([], [])
+		for node in treeNodes(self.root):
+			footprints[isinstance(node, ChanceNode)].append(nodeFootprint(node))
+		self.treeNodes = len(footprints[0]) + len(footprints[1])
+		self.measured = sum(footprints[0]) + sum(footprints[1])
+		player, chance = [float(sum(sizes)) / len(sizes) if sizes else None for sizes in footprints]
+		# a kind not in the tree yet is taken to be as large as the other
+		self.playerBytes = player if player is not None else chance
+		self.chanceBytes = chance if chance is not None else player
+
+		table = self.root.table
+		self.entries = 0
+		self.entryBytes = 0.0
+		if table is not None and table.nodes:
+			size = table.tableFootprint()
+			self.measured += size
+			self.entries = len(table.nodes)
+			self.entryBytes = float(size) / self.entries
+
+		self.allocated = Tree.allocated
+		self.chanceAllocated = Tree.chanceAllocated
+		self.checkpoint = self.measured + (self.limit - self.measured) / 2.0
+
+	"""
+		Estimated bytes taken by the tree and the transposition table
+	"""
+	def used(self):
+		chance = Tree.chanceAllocated - self.chanceAllocated
+		player = Tree.allocated - self.allocated - chance
+		total = self.measured + player * self.playerBytes + chance * self.chanceBytes
+		table = self.root.table
+		if table is not None:
+			total += (len(table.nodes) - self.entries) * self.entryBytes
+		return total
+
+	"""
+		Whether the next iteration may take the tree over the limit: the
+		estimate plus the most that the search has grown between two calls
+		reaches it
+	"""
+	def full(self):
+		used = self.used()
+		self.step = max(self.step, used - self.last)
+		if used < self.limit and (used >= self.checkpoint or Tree.allocated - self.allocated >= self.treeNodes):
+			self.measure()
+			used = self.used()
+		self.last = used
+		return used + self.step >= self.limit
+
+
+
+"""
+	Combines root children statistics reported by independent searches of
+	`state` (root parallelization). `reports` holds one list per search of
+	(move, childState, value, numSimulations) tuples; statistics are summed
+	per move into a single child of the returned root.
+"""
+def merge_roots(state, reports):
+	root = UctTree(state)
+	children = {}
+	for report in reports:
+		for move, childState, value, numSimulations in report:
+			if move not in children:
+				children[move] = UctTree(childState, lastMove=move)
+				root.addChild(children[move], move)
+			children[move].value += value
+			children[move].numSimulations += numSimulations
+			root.numSimulations += numSimulations
+	return root
 
 
 
@@ -220,10 +622,13 @@ class Tree:
 	simulation policy
 """
 class UctTree(Tree):
+
+	__slots__ = ("heuristic_value", "table")
 	
-	def __init__(self,state,lastMove=None,score=0):
+	def __init__(self,state,lastMove=None,score=0,table=None):
 		Tree.__init__(self,state,lastMove,score)
-		self.heuristic_value = heuristic(state)
+		self.heuristic_value = board_heuristic(state)
+		self.table = table # transposition table shared by the whole search, if any
 		
 	"""""""""""""""
 
@@ -236,13 +641,13 @@ class UctTree(Tree):
 
 	
 	def expand(self):
-		self.expand_one_random()
+		if self.getUntried() != []:
+			self.expand_one_random()
 		# self.expand_all()
 
 	def simulate(self):
-		# return self.simulate_score()
-		# return self.simulate_highest_tile()
-		return self.simulate_heuristic()
+		# rollout policy chosen with ROLLOUTPOLICY or setRolloutPolicy, see ROLLOUTS
+		return rolloutPolicy(self)
 
 	
 	"""""""""""""""
@@ -262,35 +667,63 @@ class UctTree(Tree):
 		# We want to select the first node we in encounter that we can expand
 		while (not current_node.expandable()):
 		
-			# Get children of current_node so we can choose among them
-			children = current_node.getExpandedChildren()
-		
 			# choose to descend unto the child with highest UCB, break ties by chance	
-			maxUCB = -1
-			for child in children:
-				thisUCB = child.upperConfidenceBound(current_node.getNumSimulations())
-				if thisUCB > maxUCB:
-					current_node = child
-					children = grandchildren
-					maxUCB = thisUCB
+			child = current_node.bestChild()
+			if child is None:
+				# game over
+				break
 
 			# append each chosen node to path
-			path = path + [current_node]
+			current_node = child
+			path.append(current_node)
 
 		return current_node, path
 
+	"""
+		The child with the highest upperConfidenceBound, breaking ties
+		randomly, or None without children. The UCB of every child is
+		computed in a single pass, with the parent's exploration term
+		2 * k * sqrt(2 * ln(n_p)) computed once.
+	"""
+	def bestChild(self):
+		n_p = self.numSimulations
+		exploration = 0.0
+		if n_p > 0:
+			exploration = 2 * UCTCONSTANT * math.sqrt(2 * math.log(n_p))
+
+		best = None
+		maxUCB = None
+		ties = 0
+		for child in self.expandedChildren:
+			n_s = child.numSimulations
+			if n_s == 0:
+				thisUCB = INFINITY
+			else:
+				thisUCB = child.value / n_s + exploration / math.sqrt(n_s) + child.heuristic_value / (n_s + 1)
+
+			if best is None or thisUCB > maxUCB:
+				best = child
+				maxUCB = thisUCB
+				ties = 1
+			elif thisUCB == maxUCB:
+				# keep each tied child with equal probability
+				ties += 1
+				if random.randrange(ties) == 0:
+					best = child
+		return best
+
 	def expand_one_random(self):
-		# choose a random available action 
-		random_action = random.choice(self.actions_left)
+		# choose a random untried action 
+		untried = self.getUntried()
+		random_action = untried.pop(random.randrange(len(untried)))
 		
 		# generate successor grid from random action
-		newGrid,newScore = game.get_successor(random_action, copy.deepcopy(self.state), self.score)
+		newGrid,newScore = game.successor(random_action, self.state, self.score)
 		
 		if newGrid == None:
 			raise Exception("hmm")
 		else:
-			newNode = UctTree(newGrid, lastMove=random_action, score=newScore)
-			self.expandedChildren.append(newNode)
+			self.addChild(self.makeChild(newGrid, random_action, newScore), random_action)
 
 	# def expand_one_heuristic(self):
 	# 	# choose a random available action 
@@ -308,15 +741,25 @@ class UctTree(Tree):
 		Expands all children
 	"""
 	def expand_all(self):
-		children = []
-		for direction in [UP, DOWN, LEFT, RIGHT]:
-			newGrid,score = game.get_successor(direction, copy.deepcopy(self.state), self.score)
-			if newGrid != None:
-				newNode = UctTree(newGrid, lastMove=direction, score=score)
-				self.expandedChildren.append(newNode)
+		while self.getUntried() != []:
+			self.expand_one_random()
 
 		self.expanded = True
 
+	"""
+		Returns the node for a successor state, shared through the
+		transposition table when one is in use
+	"""
+	def makeChild(self, state, move, score):
+		if self.table is None:
+			return UctTree(state, lastMove=move, score=score)
+
+		node = self.table.lookup(state, PLAYER)
+		if node is None:
+			node = UctTree(state, lastMove=move, score=score, table=self.table)
+			self.table.store(state, PLAYER, node)
+		return node
+
 
 	"""
 		Upper Confidence Bound equation
@@ -339,77 +782,136 @@ class UctTree(Tree):
 		h = self.heuristic_value
 
 		if self.numSimulations == 0:
-			return float("inf")
+			return INFINITY
 		else:
 			return self.getValue() + (2 * k * math.sqrt((2 * math.log(n_p))/n_s)) + (h / (n_s + 1))
 
 	"""
-		Simulates a randomly played game from self & returns the final score
+		Simulates a game of random legal moves from self & returns the final
+		score, like simulate_uniform
 	"""
 	def simulate_score(self):
-		randomMove = random.choice([UP, DOWN, LEFT, RIGHT])
-		currentNodeState = copy.deepcopy(self.state)
-		currentNodeScore = copy.deepcopy(self.score)
-		successor,successorScore = game.get_successor(randomMove, currentNodeState, currentNodeScore)
-		while (successor != None):
-			currentNodeState = successor
-			currentNodeScore = successorScore
-			randomMove = random.choice([UP, DOWN, LEFT, RIGHT])
-			successor,successorScore = game.get_successor(randomMove, currentNodeState, successorScore)
-			
-		return currentNodeScore
+		return self.simulate_uniform()
 
 	"""
-		Simulates a randomly played game from self & returns the highest tile
+		Simulates a game of random legal moves from self & returns the highest tile
 	"""
 	def simulate_highest_tile(self):
-		
-		randomMove = random.choice([UP, DOWN, LEFT, RIGHT])
-		currentNodeState = copy.deepcopy(self.state)
-		currentNodeScore = self.highest_tile(currentNodeState)
-		successor,_ = game.get_successor(randomMove, currentNodeState, currentNodeScore)
-		successorScore = self.highest_tile(successor)
-
-		while successor != None:
-			successorScore = self.highest_tile(successor)
-			currentNodeState = successor
-			currentNodeScore = successorScore
-			randomMove = random.choice([UP, DOWN, LEFT, RIGHT])
-			successor, _ = game.get_successor(randomMove, currentNodeState, successorScore)
-			
-		return currentNodeScore
+		state = self.state
+		moves = 0
+		legal = game.legal_moves(state)
+		while legal:
+			state, _ = game.successor(random.choice(legal), state, 0)
+			moves += 1
+			legal = game.legal_moves(state)
+
+		self.rolloutLength = moves
+		return self.highest_tile(state)
 	"""
-	
-	TODO: Simulates a game played using heuristics & returns final score 
+		Simulates a game of greedy moves on the heuristic (heuristic_evaluate)
+		& returns the heuristic of the last board with a legal move
 	"""
 	def simulate_heuristic(self):
-		best_successor = copy.deepcopy(self.state)
-		best_score = 0
-
-		while (best_successor != None):
-			
-			current_state = best_successor	
-			best_score = -1
-			best_move = None
+		board = self.state
+		value = None
+		last_value = None
+
+		moves = 0
+		while True:
+			best_score = -INFINITY
 			best_successor = None
-			
+
 			for direction in [UP, DOWN, LEFT, RIGHT]:
-				current_state_copy = copy.deepcopy(current_state)
-				successor,_ = game.get_successor(direction, current_state_copy, 0)	
+				successor,_ = game.successor(direction, board, 0)
 				if successor != None:
-					successor_score = heuristic(successor)
+					successor_score = heuristic_evaluate(successor)
 					if successor_score > best_score:
 						best_score = successor_score
-						best_move = direction
 						best_successor = successor
 
-		return best_score
+			if best_successor == None:
+				break
+			# board has a legal move
+			last_value = value
+			board, value = best_successor, best_score
+			moves += 1
+
+		self.rolloutLength = moves
+		if last_value == None:
+			# the rollout's first board was the last with a legal move, or lost
+			last_value = heuristic_evaluate(self.state)
+		return last_value
+
+	"""
+		Simulates a game of uniformly random legal moves & returns the final score
+	"""
+	def simulate_uniform(self):
+		_, score, self.rolloutLength = game.rollout(self.state, self.score)
+		return score
+
+	"""
+		Simulates a game played like main.corner_play (up, then left, then
+		right, then down, whichever is legal first) & returns the final score
+	"""
+	def simulate_corner(self):
+		state = self.state
+		score = self.score
+		moves = 0
+		legal = game.legal_moves(state)
+		while legal:
+			for direction in CORNER_ORDER:
+				if direction in legal:
+					break
+			state, score = game.successor(direction, state, score)
+			moves += 1
+			legal = game.legal_moves(state)
+
+		self.rolloutLength = moves
+		return score
+
+	"""
+		Simulates a game that plays a random legal move with probability
+		ROLLOUTEPSILON and otherwise the move maximizing the score gained
+		plus the heuristic of the afterstate & returns the final score
+	"""
+	def simulate_epsilon_greedy(self):
+		state = self.state
+		score = self.score
+		moves = 0
+		legal = game.legal_moves(state)
+		while legal:
+			if random.random() < ROLLOUTEPSILON:
+				direction = random.choice(legal)
+			else:
+				best = None
+				for move in legal:
+					afterstate, afterScore = game.afterstate(move, state, score)
+					value = afterScore + board_heuristic(afterstate)
+					if best is None or value > best:
+						best = value
+						direction = move
+			state, score = game.successor(direction, state, score)
+			moves += 1
+			legal = game.legal_moves(state)
+
+		self.rolloutLength = moves
+		return score
+
+	"""
+		Plays at most ROLLOUTDEPTH uniformly random legal moves (all of them
+		if None) & returns the score reached plus the evaluation of the final
+		board by the rollout evaluator (see EVALUATORS)
+	"""
+	def simulate_truncated(self):
+		state, score, self.rolloutLength = game.rollout(self.state, self.score, ROLLOUTDEPTH)
+		return score + rolloutEvaluator(state)
 
 
 	def highest_tile(self,grid):
 	    if grid == None:
 	    	return 0
 	    else:
+		    grid = game.to_grid(grid)
 		    highest = -1
 		    for row in grid:
 		        for element in row:
@@ -424,11 +926,12 @@ class UctTree(Tree):
 	def evaluate_secure(self):
 		bestVal = -1
 		bestNode = None
-		for child in self.expandedChildren:
+		for child, move in zip(self.expandedChildren, self.childMoves):
 			thisVal = child.upperConfidenceBound(self.getNumSimulations()) # secure child
 			# thisVal = child.numSimulations # most robust child
 			if (thisVal > bestVal) or (thisVal == bestVal and random.random() >= 0.5):
 				bestNode = child
+				bestMove = move
 				bestVal = thisVal
 
 		if bestNode == None:
@@ -436,7 +939,6 @@ class UctTree(Tree):
 			return random.choice([UP, DOWN, LEFT, RIGHT])
 		else:
 			# moves = ["up", "down","left","right"]
-			bestMove = bestNode.getLastMove() 
 			# print "non random move: " + str(moves[bestMove - 1])
 			return bestMove
 
@@ -453,8 +955,186 @@ class UctTree(Tree):
 
 
 
+"""
+	Rollout policies of UctTree.simulate by name. Each takes the node and
+	returns the value of a simulation from it, setting node.rolloutLength.
+	Add policies with registerRollout.
+"""
+ROLLOUTS = {"heuristic": UctTree.simulate_heuristic,
+	"score": UctTree.simulate_score,
+	"highest tile": UctTree.simulate_highest_tile,
+	"uniform": UctTree.simulate_uniform,
+	"corner": UctTree.simulate_corner,
+	"epsilon": UctTree.simulate_epsilon_greedy,
+	"truncated": UctTree.simulate_truncated}
+
+def registerRollout(name, policy):
+	ROLLOUTS[name] = policy
+
+"""
+	Makes `name` the rollout policy of every UctTree
+"""
+def setRolloutPolicy(name):
+	global rolloutPolicy, rolloutPolicyName
+	if name not in ROLLOUTS:
+		raise ValueError("unknown rollout policy: " + str(name))
+	rolloutPolicy = ROLLOUTS[name]
+	rolloutPolicyName = name
+
+setRolloutPolicy(ROLLOUTPOLICY)
+
+
+
+"""
+	UCT tree with explicit chance nodes. Player nodes (this class) hold a
+	board after a tile spawn and have one ChanceNode child per legal move.
+	A ChanceNode holds the afterstate (tiles moved, no new tile yet) and its
+	children are player nodes for the spawns sampled from it, so the chance
+	node's statistics are shared across every spawn rather than frozen to a
+	single sampled one.
+
+	Spawns are sampled by their 0.9/0.1 probabilities. Progressive widening
+	caps a chance node with n simulations at
+	ceil(WIDENINGCONSTANT * n^WIDENINGEXPONENT) spawn children; once the cap
+	is reached, an unexplored spawn is replaced by an existing child drawn in
+	proportion to its spawn probability.
+"""
+class ChanceUctTree(UctTree):
+
+	__slots__ = ()
+
+	def expand_one_random(self):
+		untried = self.getUntried()
+		move = untried.pop(random.randrange(len(untried)))
+		self.addChild(self.makeChanceNode(move), move)
+
+	"""
+		The chance node of the afterstate of `move`, shared through the
+		transposition table when one is in use
+	"""
+	def makeChanceNode(self, move):
+		afterstate, score = game.afterstate(move, self.state, self.score)
+		if self.table is None:
+			return ChanceNode(afterstate, move, score)
+
+		node = self.table.lookup(afterstate, CHANCE)
+		if node is None:
+			node = ChanceNode(afterstate, move, score, self.table)
+			self.table.store(afterstate, CHANCE, node)
+		return node
+
+	"""
+		UCT over the chance children of player nodes; at each chance node a
+		spawn is sampled to continue the descent. Both node kinds are added
+		to the path.
+	"""
+	def uct(self):
+		current_node = self
+		path = [current_node]
+
+		while (not current_node.expandable()):
+			chance_node = current_node.bestChild()
+			if chance_node is None:
+				# game over
+				break
+
+			current_node = chance_node.sampleOutcome()
+			path.append(chance_node)
+			path.append(current_node)
+
+		return current_node, path
+
+	"""
+		Used by tree reuse: the player node reached by playing `move` and
+		seeing the spawn that produced `state`, if it was explored
+	"""
+	def findChild(self, move, state):
+		for child, childMove in zip(self.expandedChildren, self.childMoves):
+			if childMove == move:
+				return child.outcomes.get(child.outcomeKey(state))
+		return None
+
+
+"""
+	Chance node of a ChanceUctTree: the afterstate of `lastMove`
+"""
+class ChanceNode(UctTree):
+
+	__slots__ = ("outcomes", "probabilities")
+
+	def __init__(self,state,lastMove,score=0,table=None):
+		# chance nodes never need the legal moves computed by Tree.__init__
+		Tree.allocated += 1
+		Tree.chanceAllocated += 1
+		self.state = state
+		self.score = score
+		self.value = 0
+		self.numSimulations = 0
+		self.expandedChildren = [] # spawn children, in creation order
+		self.childMoves = [] # spawns are not moves
+		self.lastMove = lastMove
+		self.expanded = False
+		self.untried = []
+		self.rolloutLength = 0
+		self.heuristic_value = board_heuristic(state)
+		self.table = table
 
+		self.outcomes = {} # spawn children keyed by board
+		self.probabilities = [] # spawn probability of each child in expandedChildren
 
+	def outcomeKey(self, state):
+		if isinstance(state, list):
+			return tuple(tuple(row) for row in state)
+		return state
 
+	def wideningLimit(self):
+		return int(math.ceil(WIDENINGCONSTANT * max(1, self.numSimulations) ** WIDENINGEXPONENT))
 
+	"""
+		Samples a spawn and returns the player node for it, creating it if
+		progressive widening allows
+	"""
+	def sampleOutcome(self):
+		board, probability = game.sample_spawn(self.state)
+		key = self.outcomeKey(board)
+		if key in self.outcomes:
+			return self.outcomes[key]
+
+		if (len(self.expandedChildren) < self.wideningLimit() and
+				not (Tree.frozen and self.expandedChildren)):
+			child = self.makeOutcome(board)
+			self.outcomes[key] = child
+			self.expandedChildren.append(child)
+			self.probabilities.append(probability)
+			return child
+
+		# widening cap reached: draw an existing spawn by its probability
+		pick = random.random() * sum(self.probabilities)
+		for child, probability in zip(self.expandedChildren, self.probabilities):
+			pick -= probability
+			if pick < 0:
+				return child
+		return self.expandedChildren[-1]
+
+	def makeOutcome(self, board):
+		score = self.score + game.spawn_score(self.state, board)
+		if self.table is None:
+			return ChanceUctTree(board, score=score)
+
+		node = self.table.lookup(board, PLAYER)
+		if node is None:
+			node = ChanceUctTree(board, score=score, table=self.table)
+			self.table.store(board, PLAYER, node)
+		return node
 
+	"""
+		Rollout from a sampled spawn. The spawn child is credited with the
+		rollout as well, since backpropagation stops at this node.
+	"""
+	def simulate(self):
+		child = self.sampleOutcome()
+		score = child.simulate()
+		self.rolloutLength = child.rolloutLength
+		child.incNumSimulations()
+		child.addValue(score)
+		return score
@@ -0,0 +1,163 @@
+"""
+Batched random rollouts
+
+Plays many random games in lockstep with NumPy. Boards are `(N, 4, 4)`
+uint8 arrays of log_2 tile exponents (0 for an empty cell). Each step packs
+every row and column into a 16-bit index, looks up all four moves at once in
+the row tables from bitboard.py, picks a random legal move per live game and
+spawns a tile on a random empty cell. Scores follow a scoring scheme (see
+scoring.py), SCORING by default.
+"""
+import numpy as np
+import bitboard
+import scoring as scoring_schemes
+from constants import *
+
+ROW_LEFT = np.array(bitboard.ROW_LEFT, dtype=np.uint16)
+ROW_RIGHT = np.array(bitboard.ROW_RIGHT, dtype=np.uint16)
+
+SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+# Order of the move axis in the candidate arrays
+DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
+
+
+def to_exponents(states):
+    """
+    Converts a list of boards, either packed bitboards or list-of-lists grids
+    of tile values, into an `(N, 4, 4)` uint8 exponent array.
+    """
+    if len(states) == 0:
+        return np.zeros((0, 4, 4), dtype=np.uint8)
+    if isinstance(states[0], (int, long)):
+        packed = np.array(states, dtype=np.uint64)
+        cells = (packed[:, None] >> CELL_SHIFTS) & np.uint64(0xF)
+        return cells.astype(np.uint8).reshape(-1, 4, 4)
+    tiles = np.array(states, dtype=np.int64)
+    exponents = np.zeros(tiles.shape, dtype=np.uint8)
+    occupied = tiles > 0
+    exponents[occupied] = np.log2(tiles[occupied]).round().astype(np.uint8)
+    return exponents
+
+
+_score_tables = {}
+
+def score_tables(scoring):
+    """
+    Score changes of a scoring scheme as arrays: of merging each packed row
+    (see bitboard.score_table), and of spawning a tile, indexed by its
+    exponent.
+    """
+    scheme = scoring_schemes.get(scoring)
+    if scheme not in _score_tables:
+        merges = np.array(bitboard.score_table(scheme), dtype=np.int64)
+        spawns = np.array([0, scheme.spawn(2), scheme.spawn(4)], dtype=np.int64)
+        _score_tables[scheme] = (merges, spawns)
+    return _score_tables[scheme]
+
+
+def from_exponents(boards):
+    """
+    Packs an `(N, 4, 4)` exponent array into a list of bitboards.
+    """
+    cells = boards.reshape(len(boards), 16).astype(np.uint64) << CELL_SHIFTS
+    return [int(board) for board in np.bitwise_or.reduce(cells, axis=1)]
+
+
+def _pack(lines):
+    """
+    Packs the last axis (4 exponents) into a 16-bit row index.
+    """
+    lines = lines.astype(np.uint16)
+    return lines[..., 0] | (lines[..., 1] << 4) | (lines[..., 2] << 8) | (lines[..., 3] << 12)
+
+
+def _unpack(rows):
+    return ((rows[..., None] >> SHIFTS) & 0xF).astype(np.uint8)
+
+
+def step(boards, rng=np.random, scoring=SCORING):
+    """
+    Plays one random legal move followed by a tile spawn on every board.
+    Returns (new_boards, gained_scores, alive) where `alive` flags the
+    boards that had a legal move; the other boards are returned unchanged.
+    """
+    merge_scores, spawn_scores = score_tables(scoring)
+    count = len(boards)
+    rows = _pack(boards)
+    cols = _pack(boards.transpose(0, 2, 1))
+
+    # (N, direction, line) candidate lines, in DIRECTIONS order
+    candidates = np.stack([ROW_LEFT[cols], ROW_RIGHT[cols],
+                           ROW_LEFT[rows], ROW_RIGHT[rows]], axis=1)
+    originals = np.stack([cols, cols, rows, rows], axis=1)
+    legal = (candidates != originals).any(axis=2)
+    alive = legal.any(axis=1)
+
+    # uniform choice among legal moves: random key per move, argmax over the legal ones
+    keys = np.where(legal, rng.random_sample(legal.shape), -1.0)
+    choice = keys.argmax(axis=1)
+    lines = candidates[np.arange(count), choice]
+
+    vertical = choice < 2
+    new_boards = _unpack(lines)
+    new_boards[vertical] = new_boards[vertical].transpose(0, 2, 1)
+    gained = np.where(vertical, merge_scores[cols].sum(axis=1), merge_scores[rows].sum(axis=1))
+
+    # spawn a 2 (90%) or 4 (10%) on a uniformly chosen empty cell
+    flat = new_boards.reshape(count, 16)
+    empty = flat == 0
+    cell = np.where(empty, rng.random_sample(empty.shape), -1.0).argmax(axis=1)
+    tile = np.where(rng.random_sample(count) <= .1, 2, 1).astype(np.uint8)
+    spawn = alive & empty.any(axis=1)
+    flat[spawn, cell[spawn]] = tile[spawn]
+    gained += np.where(spawn, spawn_scores[tile], 0)
+
+    new_boards[~alive] = boards[~alive]
+    gained[~alive] = 0
+    return new_boards, gained, alive
+
+
+def play(boards, scores=None, rng=np.random, depth=None, scoring=SCORING):
+    """
+    Plays random legal moves on all `boards` until every game is over, or
+    for at most `depth` moves if given. Returns (final_boards, final_scores,
+    lengths), one entry per board. `scores` gives the starting score of each
+    game, and `scoring` the scheme, a number of scoring.SCHEMES or a
+    scoring.Scoring.
+    """
+    boards = np.array(boards, dtype=np.uint8)
+    count = len(boards)
+    if scores is None:
+        final_scores = np.zeros(count, dtype=np.int64)
+    else:
+        final_scores = np.array(scores, dtype=np.int64)
+    lengths = np.zeros(count, dtype=np.int64)
+
+    live = np.arange(count)
+    moves = 0
+    while len(live) and (depth is None or moves < depth):
+        new_boards, gained, alive = step(boards[live], rng, scoring)
+        final_scores[live] += gained
+        lengths[live] += alive
+        boards[live] = new_boards
+        live = live[alive]
+        moves += 1
+    return boards, final_scores, lengths
+
+
+def simulate(boards, scores=None, rng=np.random, return_lengths=False, scoring=SCORING):
+    """
+    Plays random legal moves on all `boards` until every game is over.
+    Returns (final_scores, highest_tiles), one entry per board; see play for
+    `scores` and `scoring`. With `return_lengths`, the number of moves of
+    each game is returned third.
+    """
+    boards, final_scores, lengths = play(boards, scores, rng, scoring=scoring)
+    # tiles never shrink, so the highest tile of a game is on its final board
+    highest = boards.reshape(len(boards), 16).max(axis=1)
+    highest_tiles = np.where(highest > 0, 1 << highest.astype(np.int64), 0)
+    if return_lengths:
+        return final_scores, highest_tiles, lengths
+    return final_scores, highest_tiles
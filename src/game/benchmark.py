@@ -0,0 +1,402 @@
+"""
+Benchmarks for the game engine and search hot paths
+
+Run from this folder with
+
+    python benchmark.py [-o <results.json>] [-c <previous.json>] [-b <name>]
+
+Every benchmark reports operations per second with a fixed seed, followed by
+the average size of a search tree node in bytes. Results are written as JSON
+(with the commit and the relevant constants) so runs on different commits can
+be compared with -c. -b runs only the benchmarks whose name contains the given
+string. Set BITBOARD and the other options in constants.py to benchmark other
+configurations.
+"""
+import copy
+import datetime
+import getopt
+import json
+import random
+import subprocess
+import sys
+import time
+import bitboard
+import game
+import MCTS
+import main
+import ntuple
+from constants import *
+
+SEED = 0
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+# Iteration budgets of the full mcts decision benchmarks
+DECISION_ITERATIONS = [5, 10, 20]
+
+
+def random_grids(count, seed=SEED):
+    rng = random.Random(seed)
+    return [[[rng.choice([0, 0, 2, 2, 4, 8, 16]) for _ in range(4)] for _ in range(4)]
+            for _ in range(count)]
+
+
+def rate(operation, items):
+    """
+    Calls `operation` on every item and returns the calls per second.
+    """
+    start = time.time()
+    for item in items:
+        operation(item)
+    return len(items) / (time.time() - start)
+
+
+def count_nodes(root):
+    """
+    Number of distinct nodes reachable from `root`.
+    """
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.extend(node.getExpandedChildren())
+    return len(seen)
+
+
+"""
+    Game engine
+"""
+def bench_merge(count=20000):
+    engine = game.TwentyFortyEight(4, 4)
+    lines = [row for grid in random_grids(count // 4) for row in grid]
+    return rate(engine.merge, lines)
+
+
+def bench_get_successor(count=5000):
+    """
+    List engine, mutating get_successor on grids built beforehand.
+    """
+    engine = game.TwentyFortyEight(4, 4)
+    random.seed(SEED)
+    return rate(lambda grid: engine.get_successor(LEFT, grid, 0), random_grids(count))
+
+
+def bench_deepcopy_get_successor(count=5000):
+    """
+    List engine, the way the search used to generate successors.
+    """
+    engine = game.TwentyFortyEight(4, 4)
+    random.seed(SEED)
+    return rate(lambda grid: engine.get_successor(LEFT, copy.deepcopy(grid), 0), random_grids(count))
+
+
+def bench_successor(count=5000):
+    """
+    Immutable successor generation of the search engine (see MCTS.game).
+    """
+    random.seed(SEED)
+    boards = [MCTS.game.from_grid(grid) for grid in random_grids(count)]
+    return rate(lambda board: MCTS.game.successor(LEFT, board, 0), boards)
+
+
+def bench_legal_moves(count=5000):
+    boards = [MCTS.game.from_grid(grid) for grid in random_grids(count)]
+    return rate(MCTS.game.legal_moves, boards)
+
+
+def bench_new_tile(count=20000):
+    engine = game.TwentyFortyEight(4, 4)
+    random.seed(SEED)
+    return rate(engine.simulate_new_tile, random_grids(count))
+
+
+def bench_bitboard_move(count=20000):
+    boards = [bitboard.from_grid(grid) for grid in random_grids(count)]
+    return rate(lambda board: bitboard.move(board, UP), boards)
+
+
+def bench_canonical(count=20000):
+    """
+    Symmetry canonicalization of the search engine (see symmetry.py).
+    """
+    boards = [MCTS.game.from_grid(grid) for grid in random_grids(count)]
+    return rate(MCTS.game.canonical, boards)
+
+
+"""
+    Heuristics and tree nodes
+"""
+def bench_heuristic(count=5000):
+    """
+    Reference heuristic on grids.
+    """
+    return rate(MCTS.heuristic, random_grids(count))
+
+
+def bench_board_heuristic(count=20000):
+    """
+    Table-driven heuristic used by the search.
+    """
+    boards = [MCTS.game.from_grid(grid) for grid in random_grids(count)]
+    return rate(MCTS.board_heuristic, boards)
+
+
+def bench_ntuple(count=20000):
+    """
+    N-tuple network evaluation of packed boards (untrained weights, same cost).
+    """
+    network = ntuple.Network()
+    boards = [bitboard.from_grid(grid) for grid in random_grids(count)]
+    return rate(network.evaluate, boards)
+
+
+def bench_node_construction(count=5000):
+    boards = [MCTS.game.from_grid(grid) for grid in random_grids(count)]
+    return rate(MCTS.UctTree, boards)
+
+
+"""
+    Rollout policies
+"""
+def bench_rollout(policy, count):
+    random.seed(SEED)
+    node = MCTS.UctTree(MCTS.game.from_grid(START))
+    return rate(lambda _: policy(node), range(count))
+
+
+def bench_simulate_score(count=200):
+    return bench_rollout(MCTS.UctTree.simulate_score, count)
+
+
+def bench_simulate_highest_tile(count=200):
+    return bench_rollout(MCTS.UctTree.simulate_highest_tile, count)
+
+
+def bench_simulate_heuristic(count=20):
+    return bench_rollout(MCTS.UctTree.simulate_heuristic, count)
+
+
+# Rollouts played by the moves/sec benchmark of each policy of MCTS.ROLLOUTS
+ROLLOUT_COUNTS = {"heuristic": 20, "epsilon": 20, "truncated": 2000}
+
+
+def bench_rollout_moves(name, count=None):
+    """
+    Moves per second played by the rollout policy `name`.
+    """
+    if count is None:
+        count = ROLLOUT_COUNTS.get(name, 200)
+    policy = MCTS.ROLLOUTS[name]
+    random.seed(SEED)
+    node = MCTS.UctTree(MCTS.game.from_grid(START))
+    moves = 0
+    start = time.time()
+    for _ in range(count):
+        policy(node)
+        moves += node.rolloutLength
+    return moves / (time.time() - start)
+
+
+"""
+    Search
+"""
+def bench_mcts_nodes(iterations=10, repeats=3):
+    """
+    Tree nodes created per second by the mcts loop of main.search.
+    """
+    random.seed(SEED)
+    state = MCTS.game.from_grid(START)
+    nodes = 0
+    start = time.time()
+    for _ in range(repeats):
+        root = main.make_root(state)
+        main.search(root, iterations)
+        nodes += count_nodes(root)
+    return nodes / (time.time() - start)
+
+
+def bench_mcts_decision(iterations, repeats=3):
+    """
+    Full mcts decisions per second with an `iterations` budget.
+    """
+    random.seed(SEED)
+    state = MCTS.game.from_grid(START)
+
+    def decide(_):
+        root = main.make_root(state)
+        main.search(root, iterations)
+        return root.evaluate()
+    return rate(decide, range(repeats))
+
+
+# Rollouts per expanded node of the leaf-parallel benchmarks
+LEAF_ROLLOUTS = [1, 4, 16]
+
+
+def bench_leaf_rollouts(rollouts, iterations=10):
+    """
+    Rollouts per second of main.search with LEAFROLLOUTS set to `rollouts`.
+    """
+    random.seed(SEED)
+    saved = main.LEAFROLLOUTS
+    main.LEAFROLLOUTS = rollouts
+    try:
+        root = main.make_root(MCTS.game.from_grid(START))
+        start = time.time()
+        main.search(root, iterations)
+        elapsed = time.time() - start
+    finally:
+        main.LEAFROLLOUTS = saved
+    return root.getNumSimulations() / elapsed
+
+
+# Thread counts of the tree-parallel scaling benchmarks
+TREE_THREADS = [1, 2, 4, 8]
+
+
+def bench_tree_parallel(threads, iterations=200):
+    """
+    Iterations per second of main.search_tree_parallel with `threads`
+    threads on one shared tree, with uniform rollouts (which can be batched).
+    """
+    random.seed(SEED)
+    saved = MCTS.rolloutPolicyName
+    MCTS.setRolloutPolicy("uniform")
+    try:
+        root = main.make_root(MCTS.game.from_grid(START))
+        start = time.time()
+        done = main.search_tree_parallel(root, iterations, threads=threads)
+        elapsed = time.time() - start
+    finally:
+        MCTS.setRolloutPolicy(saved)
+    return done / elapsed
+
+
+def bytes_per_node(iterations=50):
+    """
+    Average size of a search tree node in bytes (see MCTS.nodeFootprint),
+    over the tree of one search from START.
+    """
+    random.seed(SEED)
+    root = main.make_root(MCTS.game.from_grid(START))
+    main.search(root, iterations)
+    return MCTS.bytesPerNode(root)
+
+
+BENCHMARKS = [("merge", bench_merge),
+              ("get_successor", bench_get_successor),
+              ("deepcopy_get_successor", bench_deepcopy_get_successor),
+              ("successor", bench_successor),
+              ("legal_moves", bench_legal_moves),
+              ("new_tile", bench_new_tile),
+              ("bitboard_move", bench_bitboard_move),
+              ("canonical", bench_canonical),
+              ("heuristic", bench_heuristic),
+              ("board_heuristic", bench_board_heuristic),
+              ("ntuple", bench_ntuple),
+              ("node_construction", bench_node_construction),
+              ("simulate_score", bench_simulate_score),
+              ("simulate_highest_tile", bench_simulate_highest_tile),
+              ("simulate_heuristic", bench_simulate_heuristic),
+              ("mcts_nodes", bench_mcts_nodes)]
+BENCHMARKS += [("rollout_moves_" + name.replace(" ", "_"), (lambda name=name: bench_rollout_moves(name)))
+               for name in sorted(MCTS.ROLLOUTS)]
+BENCHMARKS += [("leaf_rollouts_" + str(rollouts), (lambda rollouts=rollouts: bench_leaf_rollouts(rollouts)))
+               for rollouts in LEAF_ROLLOUTS]
+BENCHMARKS += [("tree_parallel_" + str(threads), (lambda threads=threads: bench_tree_parallel(threads)))
+               for threads in TREE_THREADS]
+BENCHMARKS += [("mcts_decision_" + str(iterations), (lambda iterations=iterations: bench_mcts_decision(iterations)))
+               for iterations in DECISION_ITERATIONS]
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configuration():
+    return {"BITBOARD": BITBOARD, "CHANCENODES": CHANCENODES,
+            "TRANSPOSITIONS": TRANSPOSITIONS, "SYMMETRY": SYMMETRY, "BATCHROLLOUTS": BATCHROLLOUTS,
+            "SCORING": SCORING, "UCTCONSTANT": UCTCONSTANT,
+            "HEURISTICCONSTANT": HEURISTICCONSTANT, "EMPTYCONSTANT": EMPTYCONSTANT,
+            "TREEMEMORY": TREEMEMORY, "VIRTUALLOSS": VIRTUALLOSS, "TREEBATCH": TREEBATCH,
+            "LEAFROLLOUTS": LEAFROLLOUTS, "NTUPLEHEURISTIC": NTUPLEHEURISTIC, "ROLLOUTPOLICY": MCTS.rolloutPolicyName}
+
+
+def run(selection=None):
+    """
+    Runs the benchmarks whose name contains `selection` (all if None) and
+    returns the report as a dict.
+    """
+    results = {}
+    for name, benchmark in BENCHMARKS:
+        if selection is not None and selection not in name:
+            continue
+        results[name] = benchmark()
+        print name.ljust(28) + str(round(results[name], 1)).rjust(14) + " ops/sec"
+    memory = {"bytes per node": bytes_per_node()}
+    print "bytes per node".ljust(28) + str(round(memory["bytes per node"], 1)).rjust(14)
+    return {"commit": commit(),
+            "date": str(datetime.datetime.now()),
+            "configuration": configuration(),
+            "results": results,
+            "memory": memory}
+
+
+def compare(report, previous):
+    """
+    Prints the ratio of every result to the one in a previous report.
+    """
+    print "\nCompared to " + str(previous.get("commit")) + ":"
+    for name, _ in BENCHMARKS:
+        if name in report["results"] and name in previous["results"]:
+            ratio = report["results"][name] / previous["results"][name]
+            print name.ljust(28) + (str(round(ratio, 2)) + "x").rjust(14)
+
+
+def usage():
+    print 'usage: benchmark.py [-o <results.json>] [-c <previous.json>] [-b <name>]'
+
+
+def main_benchmark(argv):
+    outfile = None
+    previous = None
+    selection = None
+    try:
+        opts, args = getopt.getopt(argv, "o:c:b:h")
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-o":
+            outfile = arg
+        elif opt == "-c":
+            previous = arg
+        elif opt == "-b":
+            selection = arg
+        else:
+            usage()
+            sys.exit(3)
+
+    report = run(selection)
+
+    if outfile is not None:
+        with open(outfile, "w") as jsonfile:
+            json.dump(report, jsonfile, indent=2, sort_keys=True)
+
+    if previous is not None:
+        with open(previous) as jsonfile:
+            compare(report, json.load(jsonfile))
+
+
+if __name__ == '__main__':
+    main_benchmark(sys.argv[1:])
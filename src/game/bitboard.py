@@ -0,0 +1,455 @@
+"""
+Bitboard 2048 engine
+
+A 4x4 board is packed into a single 64-bit integer. Each cell is a 4-bit
+nibble holding the log_2 exponent of its tile (0 for an empty cell), so the
+cell at (row, col) lives at bit offset 16 * row + 4 * col. A 16-bit row can
+therefore index directly into precomputed tables, and a move is four table
+lookups (plus a transpose for vertical moves).
+
+Boards are plain integers, so they are immutable and hashable: successors
+never need to be deep-copied.
+"""
+import random
+import scoring as scoring_schemes
+import symmetry
+from constants import *
+
+ROW_MASK = 0xFFFF
+
+# Exponent 15 (32768) is the largest value a nibble can hold; two such tiles
+# are left unmerged rather than overflowing into the neighbouring cell.
+MAX_EXPONENT = 15
+
+# Precomputed row tables, indexed by a packed 16-bit row
+ROW_LEFT = [0] * 65536   # row after sliding towards column 0
+ROW_RIGHT = [0] * 65536  # row after sliding towards column 3
+ROW_SCORE = [0] * 65536  # traditional score gained by merging the row
+COL_UP = [0] * 65536    # ROW_LEFT result laid out as a column (nibble i at bit 16 * i)
+COL_DOWN = [0] * 65536  # ROW_RIGHT result laid out as a column
+ROW_LEGAL = [0] * 65536  # bit 0 set if sliding left changes the row, bit 1 for right
+ROW_EMPTY = [()] * 65536 # bit offsets (4 * col) of the empty cells in the row
+ROW_REVERSE = [0] * 65536 # row read from right to left
+ROW_COLUMN = [0] * 65536  # row laid out as a column, so four lookups transpose a board
+
+
+def _reverse_row(row):
+    return (((row & 0xF) << 12) | ((row >> 4 & 0xF) << 8) |
+            ((row >> 8 & 0xF) << 4) | (row >> 12 & 0xF))
+
+
+def _row_to_column(row):
+    return ((row & 0xF) | ((row >> 4 & 0xF) << 16) |
+            ((row >> 8 & 0xF) << 32) | ((row >> 12 & 0xF) << 48))
+
+
+def _slide_left(exponents):
+    """
+    Merges a list of exponents towards index 0, returning the new list and
+    the exponents of the pairs that merged.
+    """
+    result = []
+    merges = []
+    last = 0
+    for value in exponents:
+        if value == 0:
+            continue
+        if value == last and value < MAX_EXPONENT:
+            result[-1] = value + 1
+            merges.append(value)
+            last = 0
+        else:
+            result.append(value)
+            last = value
+    return result + [0] * (4 - len(result)), merges
+
+
+def _build_tables():
+    empties = {}
+    for row in range(65536):
+        exponents = [(row >> (4 * col)) & 0xF for col in range(4)]
+        merged, merges = _slide_left(exponents)
+        left = merged[0] | (merged[1] << 4) | (merged[2] << 8) | (merged[3] << 12)
+        reverse = _reverse_row(row)
+        ROW_REVERSE[row] = reverse
+        ROW_LEFT[row] = left
+        ROW_RIGHT[reverse] = _reverse_row(left)
+        ROW_SCORE[row] = sum(1 << (value + 1) for value in merges)
+        offsets = tuple(4 * col for col in range(4) if not exponents[col])
+        ROW_EMPTY[row] = empties.setdefault(offsets, offsets)
+    for row in range(65536):
+        ROW_COLUMN[row] = _row_to_column(row)
+        COL_UP[row] = _row_to_column(ROW_LEFT[row])
+        COL_DOWN[row] = _row_to_column(ROW_RIGHT[row])
+        ROW_LEGAL[row] = (ROW_LEFT[row] != row) | ((ROW_RIGHT[row] != row) << 1)
+
+_build_tables()
+
+
+def transpose(board):
+    """
+    Swaps rows and columns of a packed board: each row, laid out as a column
+    by ROW_COLUMN, becomes a column. Table lookups keep the result a plain
+    int on Python 2 when the board is one, where bit masks over all 64 bits
+    would make it a long.
+    """
+    column = ROW_COLUMN
+    return (column[board & ROW_MASK] | (column[(board >> 16) & ROW_MASK] << 4) |
+            (column[(board >> 32) & ROW_MASK] << 8) | (column[board >> 48] << 12))
+
+
+def mirror(board):
+    """
+    Reverses every row of a packed board (left <-> right).
+    """
+    return (((board & 0x000F000F000F000F) << 12) | ((board & 0x00F000F000F000F0) << 4) |
+            ((board >> 4) & 0x00F000F000F000F0) | ((board >> 12) & 0x000F000F000F000F))
+
+
+def flip(board):
+    """
+    Reverses the order of the rows of a packed board (up <-> down).
+    """
+    return (((board & 0xFFFF) << 48) | ((board & 0xFFFF0000) << 16) |
+            ((board >> 16) & 0xFFFF0000) | (board >> 48))
+
+
+def canonical(board):
+    """
+    Smallest of the eight symmetric images of a packed board, and the
+    permutation mapping its moves to moves on that image (see symmetry.py).
+    """
+    mirrored = mirror(board)
+    candidates = [board, mirrored, flip(board), flip(mirrored)]
+    candidates += [transpose(image) for image in candidates]
+    best = min(range(8), key=candidates.__getitem__)
+    return candidates[best], symmetry.PERMUTATIONS[best]
+
+
+def _move_rows(board, table, scores=ROW_SCORE):
+    """
+    Applies a row table to all four rows. Returns the new board and the
+    score gained according to the `scores` row table.
+    """
+    r0 = board & ROW_MASK
+    r1 = (board >> 16) & ROW_MASK
+    r2 = (board >> 32) & ROW_MASK
+    r3 = board >> 48
+    moved = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    return moved, scores[r0] + scores[r1] + scores[r2] + scores[r3]
+
+
+def _move_columns(board, table, scores=ROW_SCORE):
+    """
+    Applies a column table to all four columns. The rows of the transposed
+    board are the columns, and the table lays each result back out as a
+    column, so no second transpose is needed.
+    """
+    board = transpose(board)
+    c0 = board & ROW_MASK
+    c1 = (board >> 16) & ROW_MASK
+    c2 = (board >> 32) & ROW_MASK
+    c3 = board >> 48
+    moved = table[c0] | (table[c1] << 4) | (table[c2] << 8) | (table[c3] << 12)
+    return moved, scores[c0] + scores[c1] + scores[c2] + scores[c3]
+
+
+def move(board, direction, scores=ROW_SCORE):
+    """
+    Slides and merges the board in `direction` without adding a new tile.
+    Returns (new_board, score gained), traditional unless another row table
+    is given as `scores` (see score_table).
+    """
+    if direction == LEFT:
+        return _move_rows(board, ROW_LEFT, scores)
+    if direction == RIGHT:
+        return _move_rows(board, ROW_RIGHT, scores)
+    if direction == UP:
+        return _move_columns(board, COL_UP, scores)
+    return _move_columns(board, COL_DOWN, scores)
+
+
+_score_tables = {}
+
+def score_table(scoring):
+    """
+    Row table of the score change of merging each row under a
+    scoring.Scoring scheme. A pair merges the same way whichever direction
+    the row slides, so one table serves all four moves. Tables are cached
+    per scheme instance.
+    """
+    if type(scoring) is scoring_schemes.Traditional:
+        return ROW_SCORE
+    if scoring not in _score_tables:
+        table = [0] * 65536
+        for row in range(65536):
+            _, merges = _slide_left([(row >> (4 * col)) & 0xF for col in range(4)])
+            table[row] = sum(scoring.merge(1 << value) for value in merges)
+        _score_tables[scoring] = table
+    return _score_tables[scoring]
+
+
+def empty_cells(board):
+    """
+    Returns the bit offsets (16 * row + 4 * col) of all empty cells.
+    """
+    cells = []
+    for shift in (0, 16, 32, 48):
+        cells.extend(shift + offset for offset in ROW_EMPTY[(board >> shift) & ROW_MASK])
+    return cells
+
+
+def add_random_tile(board):
+    """
+    Places a 2 (90%) or a 4 (10%) on a uniformly chosen empty cell.
+    """
+    rows = (ROW_EMPTY[board & ROW_MASK], ROW_EMPTY[(board >> 16) & ROW_MASK],
+            ROW_EMPTY[(board >> 32) & ROW_MASK], ROW_EMPTY[board >> 48])
+    index = int(random.random() * (len(rows[0]) + len(rows[1]) + len(rows[2]) + len(rows[3])))
+    shift = 0
+    for offsets in rows:
+        if index < len(offsets):
+            if random.random() <= .1:
+                return board | (2 << (shift + offsets[index]))
+            return board | (1 << (shift + offsets[index]))
+        index -= len(offsets)
+        shift += 16
+    return board
+
+
+# Legal direction lists indexed by a 4-bit mask whose bits are, from the
+# lowest: left, right, up, down
+LEGAL_DIRECTIONS = [[direction for bit, direction in [(2, UP), (3, DOWN), (0, LEFT), (1, RIGHT)]
+                     if (mask >> bit) & 1] for mask in range(16)]
+
+
+def legal_directions(board):
+    """
+    Returns the legal directions as a list, in UP, DOWN, LEFT, RIGHT order.
+    """
+    horizontal = (ROW_LEGAL[board & ROW_MASK] | ROW_LEGAL[(board >> 16) & ROW_MASK] |
+                  ROW_LEGAL[(board >> 32) & ROW_MASK] | ROW_LEGAL[board >> 48])
+    board = transpose(board)
+    vertical = (ROW_LEGAL[board & ROW_MASK] | ROW_LEGAL[(board >> 16) & ROW_MASK] |
+                ROW_LEGAL[(board >> 32) & ROW_MASK] | ROW_LEGAL[board >> 48])
+    return LEGAL_DIRECTIONS[(vertical << 2) | horizontal]
+
+
+def rollout(board, score=0, depth=None, scores=ROW_SCORE, spawns=(0, 0)):
+    """
+    Plays uniformly random legal moves until the game is over, or for at
+    most `depth` moves. Returns the final board, the score accumulated along
+    the way (merges scored by the `scores` row table, spawns of a 2 and a 4
+    by `spawns`) and the number of moves played.
+
+    This is the innermost loop of the search, so legal_directions, move and
+    add_random_tile are inlined (transpose too): the rows and columns of the
+    board are read once per move and serve both the legality check and the
+    move. Random numbers are drawn as by those functions and random.choice,
+    so a seeded rollout plays the same game as a loop over them.
+    """
+    rand = random.random
+    mask = ROW_MASK
+    legal = ROW_LEGAL
+    column = ROW_COLUMN
+    left, right, up, down = ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN
+    empty = ROW_EMPTY
+    moves = 0
+    while moves != depth:
+        r0, r1, r2, r3 = board & mask, (board >> 16) & mask, (board >> 32) & mask, board >> 48
+        columns = column[r0] | (column[r1] << 4) | (column[r2] << 8) | (column[r3] << 12)
+        c0, c1, c2, c3 = columns & mask, (columns >> 16) & mask, (columns >> 32) & mask, columns >> 48
+        directions = LEGAL_DIRECTIONS[((legal[c0] | legal[c1] | legal[c2] | legal[c3]) << 2) |
+                                      legal[r0] | legal[r1] | legal[r2] | legal[r3]]
+        if not directions:
+            break
+
+        direction = directions[int(rand() * len(directions))]
+        if direction == LEFT:
+            moved = left[r0] | (left[r1] << 16) | (left[r2] << 32) | (left[r3] << 48)
+            score += scores[r0] + scores[r1] + scores[r2] + scores[r3]
+        elif direction == RIGHT:
+            moved = right[r0] | (right[r1] << 16) | (right[r2] << 32) | (right[r3] << 48)
+            score += scores[r0] + scores[r1] + scores[r2] + scores[r3]
+        elif direction == UP:
+            moved = up[c0] | (up[c1] << 4) | (up[c2] << 8) | (up[c3] << 12)
+            score += scores[c0] + scores[c1] + scores[c2] + scores[c3]
+        else:
+            moved = down[c0] | (down[c1] << 4) | (down[c2] << 8) | (down[c3] << 12)
+            score += scores[c0] + scores[c1] + scores[c2] + scores[c3]
+
+        e0, e1, e2, e3 = empty[moved & mask], empty[(moved >> 16) & mask], empty[(moved >> 32) & mask], empty[moved >> 48]
+        n0 = len(e0)
+        n1 = n0 + len(e1)
+        n2 = n1 + len(e2)
+        index = int(rand() * (n2 + len(e3)))
+        if index < n0:
+            cell = e0[index]
+        elif index < n1:
+            cell = 16 + e1[index - n0]
+        elif index < n2:
+            cell = 32 + e2[index - n1]
+        else:
+            cell = 48 + e3[index - n2]
+        if rand() <= .1:
+            board = moved | (2 << cell)
+            score += spawns[1]
+        else:
+            board = moved | (1 << cell)
+            score += spawns[0]
+        moves += 1
+    return board, score, moves
+
+
+def random_rollout(board, score=0):
+    """
+    Plays uniformly random legal moves until the game is over. Returns the
+    final board and the traditional score accumulated along the way.
+    """
+    board, score, _ = rollout(board, score)
+    return board, score
+
+
+def get_exponent(board, row, col):
+    return (board >> (16 * row + 4 * col)) & 0xF
+
+
+def from_grid(grid):
+    """
+    Packs a list-of-lists grid of tile values into a board. Raises
+    ValueError unless the grid is 4x4 with tiles of at most 2^MAX_EXPONENT.
+    """
+    if len(grid) != 4 or any(len(row) != 4 for row in grid):
+        raise ValueError("bitboards only hold 4x4 grids")
+    board = 0
+    for row in range(4):
+        for col in range(4):
+            tile = grid[row][col]
+            if tile:
+                exponent = tile.bit_length() - 1
+                if exponent > MAX_EXPONENT:
+                    raise ValueError("tile " + str(tile) + " does not fit in a bitboard cell")
+                board |= exponent << (16 * row + 4 * col)
+    return board
+
+
+def to_grid(board):
+    """
+    Unpacks a board into a list-of-lists grid of tile values.
+    """
+    grid = []
+    for row in range(4):
+        values = []
+        for col in range(4):
+            exponent = get_exponent(board, row, col)
+            values.append(1 << exponent if exponent else 0)
+        grid.append(values)
+    return grid
+
+
+def highest_tile(board):
+    highest = 0
+    while board:
+        if board & 0xF > highest:
+            highest = board & 0xF
+        board >>= 4
+    return 1 << highest if highest else 0
+
+
+class Bitboard:
+    """
+    Simulation engine over packed boards. Offers the same `get_successor` and
+    `legal_moves` interface as `TwentyFortyEight`, so search code can switch
+    between the two representations.
+    """
+    def __init__(self, scoring=0):
+        self._scoring = scoring_schemes.get(scoring)
+        # score changes of merging each row, and of spawning a 2 or a 4
+        self._merge_scores = score_table(self._scoring)
+        self._spawn_scores = (self._scoring.spawn(2), self._scoring.spawn(4))
+
+    def get_successor(self, direction, board, score):
+        """
+        Move all tiles in the given direction and add a new tile if any
+        tiles moved. Returns (None, score) if the move is illegal.
+        """
+        moved, gained = move(board, direction, self._merge_scores)
+        if moved == board:
+            return None, score
+        spawned = add_random_tile(moved)
+        # the new tile is the only difference: exponent 1 (a 2) or 2 (a 4)
+        four = (spawned ^ moved) & 0x2222222222222222 != 0
+        return spawned, score + gained + self._spawn_scores[four]
+
+    def get_afterstate(self, direction, board, score):
+        """
+        Move all tiles in the given direction without adding a new tile.
+        Returns (None, score) if the move is illegal.
+        """
+        moved, gained = move(board, direction, self._merge_scores)
+        if moved == board:
+            return None, score
+        return moved, score + gained
+
+    def sample_spawn(self, board):
+        """
+        Returns the board with a random new tile added, and the probability
+        of that outcome.
+        """
+        empties = empty_cells(board)
+        cell = random.choice(empties)
+        if random.random() <= .1:
+            return board | (2 << cell), .1 / len(empties)
+        return board | (1 << cell), .9 / len(empties)
+
+    def spawn_score(self, afterstate, board):
+        """
+        Score change of the new tile that turned `afterstate` into `board`.
+        """
+        return self._spawn_scores[(board ^ afterstate) & 0x2222222222222222 != 0]
+
+    def start(self):
+        """
+        Board and score of a new game: two random tiles on an empty board,
+        their spawns scored as by TwentyFortyEight.reset.
+        """
+        board = 0
+        score = 0
+        for _ in range(2):
+            spawned = add_random_tile(board)
+            score += self.spawn_score(board, spawned)
+            board = spawned
+        return board, score
+
+    def rollout(self, board, score, depth=None):
+        """
+        Plays uniformly random legal moves from `board` until the game is
+        over, or for at most `depth` moves. Returns the final board, the
+        score and the number of moves played.
+        """
+        return rollout(board, score, depth, self._merge_scores, self._spawn_scores)
+
+    # Packed boards are immutable, so the methods above never modify their
+    # input and double as the immutable successor API
+    successor = get_successor
+    afterstate = get_afterstate
+
+    def legal_moves(self, board):
+        legal = legal_directions(board)
+        if legal == []:
+            legal = None
+        else:
+            legal = list(legal)
+        return legal
+
+    def from_grid(self, grid):
+        return from_grid(grid)
+
+    def to_grid(self, board):
+        return to_grid(board)
+
+    def highest_tile(self, board):
+        return highest_tile(board)
+
+    def canonical(self, board):
+        return canonical(board)
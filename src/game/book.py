@@ -0,0 +1,257 @@
+"""
+Opening book
+
+A persistent cache of root statistics learned by previous searches, shared
+by the games of an experiment, by its parallel workers and across runs. For
+every board, the book holds the simulations and mean value of each move at
+the root, and how often the entry was used. main.mcts consults it to
+warm-start the root children of a search, or to play the best move without
+searching once the book has seen enough simulations of a position.
+
+File format: a 16-byte header (MAGIC, version, number of sorted records)
+followed by fixed-size RECORD entries. The first `sorted` records are unique
+boards in increasing key order, as written by compact(); every search appends
+one more record after them. Several records of a board add up: simulations
+and hits are summed and values averaged by simulations. Keys are canonical
+boards (see symmetry.py) packed like bitboard.py (4 bits per cell), with the
+moves of a record relabelled to the canonical board, so the eight symmetric
+images of a position share one entry. Only 4x4 boards are supported.
+
+The file is memory mapped when a Book is opened. The sorted part is searched
+in place with a binary search, only the appended records are indexed in
+memory. Appends and compactions hold an exclusive lock on `<path>.lock`, so
+parallel experiment workers can share one book. Once the file holds more
+than twice `capacity` records, it is compacted: records are merged per board
+and only the `capacity` most hit boards (then the most simulated) are kept. The
+file is replaced atomically, so readers keep their mapping of the old one;
+load() reads the size, header and records of the one file it opened.
+
+Values depend on the rollout policy and scoring scheme, so use one book per
+configuration.
+"""
+import fcntl
+import os
+import struct
+import numpy as np
+import bitboard
+from constants import *
+
+MAGIC = "2048BOOK"
+VERSION = 2
+HEADER = struct.Struct("<8sII")
+
+# Order of the move axis of a record
+DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
+
+RECORD = np.dtype([("key", "<u8"),
+                   ("hits", "<u4"),
+                   ("visits", "<u4", (4,)),
+                   ("value", "<f4", (4,))])
+
+
+def board_key(grid):
+    """
+    Book key of a list-of-lists grid of tile values, and for each move of
+    DIRECTIONS the index of the corresponding move in its records.
+    """
+    board, permutation = bitboard.canonical(bitboard.from_grid(grid))
+    return board, [DIRECTIONS.index(permutation[move]) for move in DIRECTIONS]
+
+
+class Entry:
+    """
+    Statistics of one board: `visits` and mean `value` of the root child of
+    each move of DIRECTIONS, and the number of times the entry was used.
+    """
+    def __init__(self, hits=0, visits=None, value=None):
+        self.hits = hits
+        self.visits = [0, 0, 0, 0] if visits is None else list(visits)
+        self.value = [0.0, 0.0, 0.0, 0.0] if value is None else list(value)
+
+    def add(self, hits, visits, value):
+        self.hits += int(hits)
+        for i in range(4):
+            total = self.visits[i] + int(visits[i])
+            if total > 0:
+                self.value[i] = (self.value[i] * self.visits[i] + float(value[i]) * int(visits[i])) / total
+            self.visits[i] = total
+
+    def simulations(self):
+        return sum(self.visits)
+
+    def best(self):
+        """
+        The simulated move with the highest mean value, or None.
+        """
+        best = None
+        for i in range(4):
+            if self.visits[i] > 0 and (best is None or self.value[i] > self.value[best]):
+                best = i
+        if best is None:
+            return None
+        return DIRECTIONS[best]
+
+
+def merge(records):
+    """
+    Merges an array of records per board into unique records, sorted by key.
+    """
+    keys, inverse = np.unique(records["key"], return_inverse=True)
+    merged = np.zeros(len(keys), dtype=RECORD)
+    merged["key"] = keys
+    np.add.at(merged["hits"], inverse, records["hits"])
+    visits = np.zeros((len(keys), 4), dtype=np.float64)
+    totals = np.zeros((len(keys), 4), dtype=np.float64)
+    np.add.at(visits, inverse, records["visits"])
+    np.add.at(totals, inverse, records["visits"] * records["value"].astype(np.float64))
+    merged["visits"] = visits
+    merged["value"] = np.where(visits > 0, totals / np.maximum(visits, 1), 0)
+    return merged
+
+
+class Book:
+    """
+    Opening book stored at `path`, compacted to `capacity` boards.
+    """
+    def __init__(self, path=OPENINGBOOK, capacity=BOOKSIZE):
+        self.path = path
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """
+        Maps the file into memory and indexes its appended records.
+        """
+        self.sorted = np.zeros(0, dtype=RECORD)
+        self.appended = {}
+        self.records = 0
+        try:
+            bookfile = open(self.path, "rb")
+        except IOError:
+            return
+
+        # the size, header and mapping all come from the opened file, which a
+        # concurrent compaction replaces by rename without modifying it
+        with bookfile:
+            size = os.fstat(bookfile.fileno()).st_size
+            if size < HEADER.size:
+                return
+            magic, version, sorted_count = HEADER.unpack(bookfile.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(self.path + " is not an opening book of version " + str(VERSION))
+
+            # a record cut short by an interrupted append is ignored
+            self.records = (size - HEADER.size) // RECORD.itemsize
+            if self.records == 0:
+                return
+            records = np.memmap(bookfile, dtype=RECORD, mode="r", offset=HEADER.size,
+                                shape=(self.records,))
+        self.sorted = records[:sorted_count]
+        for record in records[sorted_count:]:
+            key = int(record["key"])
+            if key not in self.appended:
+                self.appended[key] = Entry()
+            self.appended[key].add(record["hits"], record["visits"], record["value"])
+
+    def lookup(self, grid):
+        """
+        Entry of the board `grid`, or None if the book has never seen it.
+        """
+        key, moves = board_key(grid)
+        entry = None
+        i = np.searchsorted(self.sorted["key"], np.uint64(key))
+        if i < len(self.sorted) and int(self.sorted["key"][i]) == key:
+            record = self.sorted[i]
+            entry = Entry(int(record["hits"]), record["visits"].tolist(), record["value"].tolist())
+        if key in self.appended:
+            if entry is None:
+                entry = Entry()
+            appended = self.appended[key]
+            entry.add(appended.hits, appended.visits, appended.value)
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Entry(entry.hits, [entry.visits[j] for j in moves], [entry.value[j] for j in moves])
+
+    def record(self, grid, visits, value, hits=0):
+        """
+        Appends the statistics of a search of `grid`: per move of DIRECTIONS
+        the simulations `visits` and their mean `value`. `hits` counts the
+        uses of the entry made by that search.
+        """
+        key, moves = board_key(grid)
+        visits = [visits[moves.index(j)] for j in range(4)]
+        value = [value[moves.index(j)] for j in range(4)]
+        record = np.zeros(1, dtype=RECORD)
+        record["key"] = key
+        record["hits"] = hits
+        record["visits"] = visits
+        record["value"] = value
+
+        with self.locked():
+            with open(self.path, "ab") as bookfile:
+                size = os.path.getsize(self.path)
+                if size < HEADER.size:
+                    bookfile.truncate(0)
+                    bookfile.write(HEADER.pack(MAGIC, VERSION, 0))
+                elif (size - HEADER.size) % RECORD.itemsize:
+                    # drop a record cut short by an interrupted append
+                    bookfile.truncate(size - (size - HEADER.size) % RECORD.itemsize)
+                bookfile.write(record.tobytes())
+            size = os.path.getsize(self.path)
+            if (size - HEADER.size) // RECORD.itemsize > 2 * self.capacity:
+                self.compact()
+                return
+
+        if key not in self.appended:
+            self.appended[key] = Entry()
+        self.appended[key].add(hits, visits, value)
+
+    def compact(self):
+        """
+        Rewrites the file with one sorted record per board, keeping the
+        `capacity` most hit boards. Called with the lock held.
+        """
+        with open(self.path, "rb") as bookfile:
+            bookfile.seek(HEADER.size)
+            content = bookfile.read()
+        records = np.frombuffer(content[:len(content) - len(content) % RECORD.itemsize], dtype=RECORD)
+        merged = merge(records)
+        if len(merged) > self.capacity:
+            order = np.lexsort((merged["visits"].sum(axis=1), merged["hits"]))[::-1]
+            merged = np.sort(merged[order[:self.capacity]], order="key")
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as bookfile:
+            bookfile.write(HEADER.pack(MAGIC, VERSION, len(merged)))
+            bookfile.write(merged.tobytes())
+        os.rename(temporary, self.path)
+        self.load()
+
+    def locked(self):
+        return _Lock(self.path + ".lock")
+
+    def report(self):
+        return ("book hits: " + str(self.hits) + ", misses: " + str(self.misses) +
+                ", records: " + str(self.records))
+
+
+class _Lock:
+    """
+    Exclusive lock on a file, held in a with block.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.lockfile = open(self.path, "a")
+        fcntl.flock(self.lockfile, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.lockfile, fcntl.LOCK_UN)
+        self.lockfile.close()
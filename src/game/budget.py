@@ -0,0 +1,157 @@
+"""
+Time budgets for the anytime search
+
+`clock` is a monotonic wall clock: time.monotonic where available, and on
+Python 2 clock_gettime(CLOCK_MONOTONIC) called through ctypes (Linux and
+macOS), so that adjustments of the system time do not cut or stretch a
+budget. Only where neither exists does it fall back to time.time.
+
+A Deadline runs search iterations until its budget is spent, reading the
+clock once per batch of iterations. Batches are sized from the measured cost
+of an iteration so that a batch fits in a fraction of the time left; near the
+deadline batches shrink to a single iteration, so a move overshoots its
+budget by at most about one iteration.
+
+A TimeBank spreads a total time budget over the moves of a game, giving
+more time to critical positions (few empty cells) and less to easy ones.
+"""
+import ctypes
+import ctypes.util
+import sys
+import time
+from constants import *
+
+# CLOCK_MONOTONIC in <time.h>
+CLOCKIDS = {"linux": 1, "darwin": 6}
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _monotonic():
+    """
+    The monotonic clock of this platform, as a function returning seconds.
+    """
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    clockid = CLOCKIDS.get(sys.platform.rstrip("0123456789"))
+    if clockid is None:
+        return time.time
+
+    # clock_gettime is in librt before glibc 2.17
+    for name in ["c", "rt"]:
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        clock_gettime.restype = ctypes.c_int
+        if clock_gettime(clockid, ctypes.byref(timespec())) != 0:
+            continue
+
+        def monotonic():
+            # a timespec per call: the call releases the GIL, and the search
+            # threads of main.search_tree_parallel read the clock concurrently
+            now = timespec()
+            clock_gettime(clockid, ctypes.byref(now))
+            return now.tv_sec + now.tv_nsec * 1e-9
+        return monotonic
+    return time.time
+
+clock = _monotonic()
+
+# Largest number of iterations run between two clock reads
+MAXBATCH = 64
+
+# Share of the remaining time a batch is sized to fill
+BATCHFRACTION = 0.5
+
+# Number of moves the time bank divides its remaining time over once a game
+# outlasts TIMEBANKMOVES
+MINBANKMOVES = 50
+
+# Multiplier of the time bank share by number of empty cells: positions with
+# at most `empty` empty cells get `weight` times the share
+CRITICALITY = [(2, 2.0), (5, 1.5), (9, 1.0), (16, 0.5)]
+
+
+class Deadline:
+    """
+    Budget of `seconds` of wall time for one move. At least one iteration is
+    always run so the search has something to evaluate.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.iterations = 0
+        self.elapsed = 0.0
+
+    def run(self, iteration):
+        """
+        Calls `iteration(counter)` until the budget is spent. Returns the
+        number of iterations run.
+        """
+        start = clock()
+        deadline = start + self.seconds
+        cost = 0.0 # most expensive mean iteration cost of a batch so far
+        batch = 1
+        now = start
+        while True:
+            for _ in range(batch):
+                iteration(self.iterations)
+                self.iterations += 1
+
+            previous = now
+            now = clock()
+            if now >= deadline:
+                break
+
+            # iterations get costlier as the tree grows, so batches at most
+            # double even when the clock says there is plenty of time left
+            cost = max(cost, (now - previous) / batch)
+            if cost > 0:
+                size = int(BATCHFRACTION * (deadline - now) / cost)
+            else:
+                size = MAXBATCH # iterations faster than the clock resolution
+            batch = max(1, min(MAXBATCH, 2 * batch, size))
+
+        self.elapsed = now - start
+        return self.iterations
+
+
+def criticality(empty):
+    """
+    Time bank multiplier of a position with `empty` empty cells.
+    """
+    for most, weight in CRITICALITY:
+        if empty <= most:
+            return weight
+    return CRITICALITY[-1][1]
+
+
+class TimeBank:
+    """
+    Per-game budget of `total` seconds, expected to last `moves` moves.
+    """
+    def __init__(self, total=TIMEBANK, moves=TIMEBANKMOVES):
+        self.remaining = total
+        self.moves = moves
+        self.played = 0
+
+    def allocate(self, empty):
+        """
+        Seconds to spend on the next move, for a position with `empty`
+        empty cells.
+        """
+        share = self.remaining / max(MINBANKMOVES, self.moves - self.played)
+        return max(0.0, min(self.remaining, share * criticality(empty)))
+
+    def charge(self, seconds):
+        """
+        Takes the time actually spent on a move out of the bank.
+        """
+        self.remaining = max(0.0, self.remaining - seconds)
+        self.played += 1
@@ -20,9 +20,116 @@ USETIMELIMIT = False
 # Computational budget in number of iterations
 ITERATIONS = 50
 
+# Number of rollouts played from each expanded node (leaf parallelization).
+# Their scores are summed and backpropagated as LEAFROLLOUTS simulations in one
+# pass; with BATCHROLLOUTS they are played as a single batch of NumPy games.
+LEAFROLLOUTS = 1
+
 # Computational budget in seconds (float)
 TIMELIMIT = 0.1
 
+# With USETIMELIMIT, total decision time of a game in seconds, spread over
+# the moves by budget.TimeBank (more time for positions with few empty cells),
+# or None to give every move TIMELIMIT. TIMEBANKMOVES is the number of moves
+# the bank is expected to last.
+TIMEBANK = None
+TIMEBANKMOVES = 1000
+
+# If true, the search shares one node between identical positions through a
+# transposition table holding at most TTSIZE nodes
+TRANSPOSITIONS = False
+TTSIZE = 100000
+
+# If true, the transposition table and expectimax's chance node cache share
+# one entry between the eight rotations and reflections of a board (see
+# symmetry.py). Exact for expectimax's own evaluator; the MCTS heuristic is
+# not fully symmetric, so shared nodes keep the heuristic of their first image.
+SYMMETRY = False
+
+# If true, mcts_play keeps the subtree under the played move and continues
+# searching it on the next move instead of starting from a fresh root.
+# Requires CHANCENODES: without chance nodes, a move's child holds a single
+# sampled spawn, which rarely is the tile the game actually spawns.
+REUSETREE = False
+
+# If true, the search separates player nodes from chance nodes (tile spawns),
+# see MCTS.ChanceUctTree. A chance node with n simulations may have at most
+# ceil(WIDENINGCONSTANT * n^WIDENINGEXPONENT) sampled spawn children.
+CHANCENODES = False
+WIDENINGCONSTANT = 1
+WIDENINGEXPONENT = 0.5
+
+# Opening book file (see book.py) shared by games, experiment workers and runs,
+# or None for no book. Searches of positions whose tiles sum to at most
+# BOOKTILESUM start from the root statistics in the book and add theirs to it.
+# Positions with at least BOOKCONFIDENCE simulations in the book are played
+# from it without searching (None to always search). The book is compacted to
+# its BOOKSIZE most used positions.
+OPENINGBOOK = None
+BOOKTILESUM = 64
+BOOKCONFIDENCE = 1000
+BOOKSIZE = 100000
+
+# Number of worker processes for root-parallel search. Each worker builds an
+# independent tree for the move and the root children statistics are summed.
+# 1 searches serially in the main process.
+WORKERS = 1
+
+# Number of threads searching one shared tree (tree parallelization, see
+# main.search_tree_parallel), each adding VIRTUALLOSS simulations of value 0
+# along its selected paths until their rollouts are backpropagated. Each
+# thread selects TREEBATCH leaves before playing all their rollouts as one
+# batch. With more than one thread, rollouts are always batched NumPy games,
+# with the same restrictions on ROLLOUTPOLICY as BATCHROLLOUTS.
+TREETHREADS = 1
+VIRTUALLOSS = 3
+TREEBATCH = 8
+
+# Computational budget of each root-parallel worker in number of iterations
+# (workers use TIMELIMIT instead if USETIMELIMIT is set)
+WORKERITERATIONS = ITERATIONS
+
+# Expectimax agent (expectimax.py): maximum search depth in moves, cumulative
+# spawn probability below which a branch is evaluated instead of searched,
+# and decision time budget per move in seconds
+EXPECTIMAXDEPTH = 6
+EXPECTIMAXPROBABILITY = 0.0001
+EXPECTIMAXTIMELIMIT = 0.01
+
+# If true, expectimax evaluates leaves with the MCTS heuristic (unscaled by
+# HEURISTICCONSTANT) instead of its own table-driven evaluator
+EXPECTIMAXHEURISTIC = False
+
+# Rollout policy of the search (see MCTS.ROLLOUTS):
+# "heuristic" -> greedy on the heuristic (without HEURISTICCONSTANT), returns
+#                the heuristic of the last board with a legal move
+# "score", "highest tile" -> random legal moves, returns the final score or
+#                             the highest tile
+# "uniform" -> random legal moves
+# "corner" -> up, left, right, down, whichever is legal first (like corner_play)
+# "epsilon" -> random legal move with probability ROLLOUTEPSILON, otherwise
+#              the move maximizing the score gained plus the heuristic
+# "truncated" -> at most ROLLOUTDEPTH random legal moves (None for the whole
+#                game), then the score plus the evaluation of the board
+#                reached by ROLLOUTEVALUATOR (see MCTS.EVALUATORS):
+#                "heuristic" (the heuristic without HEURISTICCONSTANT),
+#                "table" (expectimax's evaluator), "ntuple"
+#                (the network of NTUPLEWEIGHTS) or "none"
+ROLLOUTPOLICY = "heuristic"
+ROLLOUTEPSILON = 0.1
+ROLLOUTDEPTH = 10
+ROLLOUTEVALUATOR = "heuristic"
+
+# N-tuple network evaluator (ntuple.py): weights file trained with
+# `python ntuple.py`, and the TD(0) learning rate of training (the share of
+# the error corrected by one update). With NTUPLEHEURISTIC, the search uses
+# the network's value of a board wherever it uses the heuristic (UCB, the
+# "heuristic" rollout policy and evaluator), unscaled by HEURISTICCONSTANT.
+# The network is also the rollout evaluator "ntuple".
+NTUPLEWEIGHTS = "ntuple.weights"
+NTUPLEALPHA = 0.1
+NTUPLEHEURISTIC = False
+
 # Exploration weighting
 UCTCONSTANT = 8000 / math.sqrt(2)
 
@@ -42,6 +149,28 @@ WIDTH = 4
 # 2 -> Score updated to the total sum of the log_2 value of the tiles
 SCORING = 0
 
+# If true, search runs on packed 64-bit boards (bitboard.py) instead of
+# list-of-lists grids, and so do the corner and random agents unless every
+# move is displayed. Only supports 4x4 boards.
+BITBOARD = False
+
+# Memory cap of the search tree of one move and its transposition table in
+# MiB, or None for no cap. Once they reach it (as estimated by
+# MCTS.TreeMemory), the search keeps simulating from the existing tree
+# without allocating nodes. Not applied by tree-parallel searches.
+TREEMEMORY = None
+
+# If true, mcts_helper plays the rollouts of all expanded children as one
+# batch of random games with NumPy (batch.py) instead of calling simulate()
+# on each child. Batched games play random legal moves, so ROLLOUTPOLICY must
+# be "uniform", "score" or "truncated" (see main.batch_rollouts).
+BATCHROLLOUTS = False
+
+# If true, mcts_play profiles the serial search of every move (time and calls
+# per phase, tree depth, nodes allocated, rollout lengths, see profiler.py) and
+# the experiments write one JSON record per move next to their csv output
+PROFILE = False
+
 """
 DO NOT MODIFY
 """
@@ -0,0 +1,184 @@
+"""
+Expectimax agent
+
+Depth-limited expectimax over packed boards (see bitboard.py). Max nodes try
+every legal move; chance nodes average over every spawn weighted by its
+probability. Chance branches whose cumulative probability falls below a
+threshold are cut off and evaluated directly, chance node values are cached
+for the duration of a move (with the depth and probability they were
+searched with), and the search deepens iteratively until the per-move time
+budget is spent, checking the clock at every chance node.
+"""
+import budget
+import bitboard
+import heuristic_table
+from constants import *
+
+# Weights of the default leaf evaluator, applied per row and per column
+LOSTPENALTY = 200000
+EMPTYWEIGHT = 270
+MERGEWEIGHT = 700
+MONOTONICITYWEIGHT = 47
+SUMWEIGHT = 11
+
+
+def _line_value(exponents):
+    """
+    Value of one row or column: rewards empty cells and possible merges,
+    penalizes large tiles and lines that are not monotonic.
+    """
+    empty = exponents.count(0)
+    merges = 0
+    previous = 0
+    counter = 0
+    for exponent in exponents:
+        if exponent == 0:
+            continue
+        if exponent == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    monotonicity_left = 0
+    monotonicity_right = 0
+    for i in range(3):
+        if exponents[i] > exponents[i+1]:
+            monotonicity_left += exponents[i] ** 4 - exponents[i+1] ** 4
+        else:
+            monotonicity_right += exponents[i+1] ** 4 - exponents[i] ** 4
+
+    total = sum(exponent ** 3.5 for exponent in exponents)
+
+    return (LOSTPENALTY + EMPTYWEIGHT * empty + MERGEWEIGHT * merges -
+            MONOTONICITYWEIGHT * min(monotonicity_left, monotonicity_right) -
+            SUMWEIGHT * total)
+
+LINE_VALUE = [_line_value([(row >> (4 * col)) & 0xF for col in range(4)]) for row in range(65536)]
+
+# Value of a lost board: below that of every board under evaluate (LINE_VALUE
+# goes negative once tiles reach about 2^13), so the search loses only when
+# every move leads there
+LOST = 8 * min(LINE_VALUE) - 1
+
+
+def evaluate(board):
+    """
+    Default leaf evaluator: sum of LINE_VALUE over the four rows and the
+    four columns, i.e. eight table lookups.
+    """
+    mask = bitboard.ROW_MASK
+    columns = bitboard.transpose(board)
+    return (LINE_VALUE[board & mask] + LINE_VALUE[(board >> 16) & mask] +
+            LINE_VALUE[(board >> 32) & mask] + LINE_VALUE[board >> 48] +
+            LINE_VALUE[columns & mask] + LINE_VALUE[(columns >> 16) & mask] +
+            LINE_VALUE[(columns >> 32) & mask] + LINE_VALUE[columns >> 48])
+
+
+def evaluate_heuristic(board):
+    """
+    Leaf evaluator using the MCTS heuristic. HEURISTICCONSTANT only weights
+    the heuristic against the UCB values of MCTS (and is 0 by default), so
+    the heuristic is left unscaled.
+    """
+    return heuristic_table.evaluate_unscaled(board)
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Expectimax:
+    """
+    Expectimax search agent. `depth` is the maximum number of moves searched,
+    `probability` the cumulative spawn probability below which a chance
+    branch is evaluated instead of searched, and `time_limit` the decision
+    budget per move in seconds.
+    """
+    def __init__(self, depth=EXPECTIMAXDEPTH, probability=EXPECTIMAXPROBABILITY,
+                 time_limit=EXPECTIMAXTIMELIMIT, evaluate=evaluate):
+        self._depth = depth
+        self._probability = probability
+        self._time_limit = time_limit
+        self._evaluate = evaluate
+        self._cache = {}
+        self._deadline = None
+        self.depth_reached = 0
+
+    def best_move(self, board):
+        """
+        Returns the best direction for `board` from the deepest search that
+        finished within the time limit, or None if there is no legal move.
+        """
+        moves = bitboard.legal_directions(board)
+        if not moves:
+            return None
+
+        self._deadline = budget.clock() + self._time_limit
+        self._cache = {}
+        self.depth_reached = 0
+        best = moves[0]
+        for depth in range(1, self._depth + 1):
+            try:
+                best = self._search_root(board, moves, depth)
+            except _Timeout:
+                break
+            self.depth_reached = depth
+        self._cache = {}
+        return best
+
+    def _search_root(self, board, moves, depth):
+        best_value = float('-inf')
+        best_move = moves[0]
+        for direction in moves:
+            afterstate, _ = bitboard.move(board, direction)
+            value = self._chance_node(afterstate, depth, 1.0)
+            if value > best_value:
+                best_value = value
+                best_move = direction
+        return best_move
+
+    def _max_node(self, board, depth, probability):
+        best_value = None
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            afterstate, _ = bitboard.move(board, direction)
+            if afterstate != board:
+                value = self._chance_node(afterstate, depth, probability)
+                if best_value is None or value > best_value:
+                    best_value = value
+        if best_value is None:
+            # no legal move: the game is lost
+            return LOST
+        return best_value
+
+    def _chance_node(self, afterstate, depth, probability):
+        # checked at every node, leaves included, so that a move overshoots
+        # its budget by at most one evaluation
+        if budget.clock() > self._deadline:
+            raise _Timeout()
+
+        if depth <= 1 or probability < self._probability:
+            return self._evaluate(afterstate)
+
+        # a cached value stands for this node if it was searched at least as
+        # deep and with at least this probability, i.e. with no more cut off
+        key = afterstate
+        if SYMMETRY:
+            key = bitboard.canonical(afterstate)[0]
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] >= depth and cached[1] >= probability:
+            return cached[2]
+
+        empties = bitboard.empty_cells(afterstate)
+        share = probability / len(empties)
+        total = 0.0
+        for cell in empties:
+            total += .9 * self._max_node(afterstate | (1 << cell), depth - 1, share * .9)
+            total += .1 * self._max_node(afterstate | (2 << cell), depth - 1, share * .1)
+        value = total / len(empties)
+
+        self._cache[key] = (depth, probability, value)
+        return value
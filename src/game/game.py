@@ -6,6 +6,8 @@ import sys, tty, termios
 import curses
 import copy
 import math
+import scoring as scoring_schemes
+import symmetry
 from constants import *
 
 # Offsets for computing tile indices in each direction.
@@ -20,7 +22,7 @@ OFFSETS = {UP: (1, 0),
 # 0 -> Traditional 2048 scoring, merges result in score of new tile added
 # 1 -> Score updated to the total sum of the tiles
 # 2 -> Score updated to the total sum of the log_2 value of the tiles -- merges can lower total score!
-# Create more in self.update_score function!
+# Create more in scoring.py! A scoring.Scoring instance can be passed instead of a number.
 
 class TwentyFortyEight:
     """
@@ -30,13 +32,15 @@ class TwentyFortyEight:
         self._height = grid_height
         self._width = grid_width
         self._grid = []
-        self._scoring = scoring
+        self._scoring = scoring_schemes.get(scoring)
+        # score changes of merging two tiles of a value, and of spawning a 2 or a 4
+        self._merge_score = self._scoring.merge
+        self._spawn_score = {2: self._scoring.spawn(2), 4: self._scoring.spawn(4)}
         self.reset()
         self._borders = {UP: [(0, col) for col in range(self._width)],
                    DOWN: [(self._height-1, col) for col in range(self._width)],
                    LEFT: [(row, 0)for row in range(self._height)],
                    RIGHT: [(row, self._width-1) for row in range(self._height)]}
-        self._score = 0
 
         if EVERY_MOVE == 1:
             self.prepare_terminal_output()
@@ -50,6 +54,13 @@ class TwentyFortyEight:
         """
         self._grid = [[0 for _ in range(self._width)]
                      for _ in range(self._height)]
+        # Empty cells of self._grid, kept up to date by every write to it
+        self._empty = [(row, col) for row in range(self._height)
+                       for col in range(self._width)]
+        # (snapshot of self._grid, its legal moves) as of the last
+        # legal_moves(self._grid), None when unknown
+        self._legal = None
+        self._score = 0
         self.new_tile()
         self.new_tile()
 
@@ -105,7 +116,9 @@ class TwentyFortyEight:
     def merge(self, line):
         """
         Function that merges a single row or column in 2048.
+        Returns the merged line and the score change of its merges.
         """
+        merge_score = self._merge_score
         score = 0
         result = []
         line_dimension = len(line)
@@ -119,7 +132,7 @@ class TwentyFortyEight:
                 if value == last_value:
                     new_tile = value*2
                     result[len(result)-1] = new_tile
-                    score += new_tile
+                    score += merge_score(value)
                     last_value = -1
                 else:
                     result.append(value)
@@ -136,21 +149,22 @@ class TwentyFortyEight:
 
     def modify(self, start, direction, steps, merged):
         """
-        modifies the grid
+        modifies the grid, returns the cells left empty
         """
-        for step in range(steps):
-            row = start[0] + step * direction[0]
-            col = start[1] + step * direction[1]
-            self._grid[row][col] = merged[step]
+        return self.simulate_modify(start, direction, steps, merged, self._grid)
 
     def simulate_modify(self, start, direction, steps, merged, grid):
         """
-        modifies the grid
+        modifies the grid, returns the cells left empty
         """
+        empty = []
         for step in range(steps):
             row = start[0] + step * direction[0]
             col = start[1] + step * direction[1]
             grid[row][col] = merged[step]
+            if merged[step] == 0:
+                empty.append((row, col))
+        return empty
 
     def move(self, direction):
         """
@@ -161,14 +175,16 @@ class TwentyFortyEight:
         changed = False
         if direction == RIGHT or direction == LEFT:
             steps = self._width
+        # every cell is rewritten by the lines below, so the empty cells are rebuilt as we go
+        empty = []
         for index in self._borders[direction]:
             cutted = self.cut(index, OFFSETS[direction], steps)
             merged, sum_score = self.merge(cutted)
-            score = self.update_score(self._score, sum_score)
-            self._score = score
+            self._score += sum_score
             if cutted != merged:
                 changed = True
-            self.modify(index, OFFSETS[direction], steps, merged)
+            empty.extend(self.modify(index, OFFSETS[direction], steps, merged))
+        self._empty = empty
         if changed:
             self.new_tile()
             self.board_print()
@@ -178,37 +194,111 @@ class TwentyFortyEight:
         Move all tiles in the given direction and add
         a new tile if any tiles moved.
         """
+        grid, score, empty = self.simulate_move(direction, grid, score)
+        if grid != None:
+            score += self._spawn_score[self.simulate_new_tile(grid, empty)]
+        return grid, score
+
+    def get_afterstate(self, direction, grid, score):
+        """
+        Move all tiles in the given direction without adding
+        a new tile. Returns None as the grid if no tiles moved.
+        """
+        grid, score, _ = self.simulate_move(direction, grid, score)
+        return grid, score
+
+    def successor(self, direction, board, score):
+        """
+        Immutable counterpart of get_successor. `board` is a tuple
+        of row tuples (see from_grid) and is not modified; returns
+        a new board (None if no tiles moved) and the score.
+        """
+        board, score = self.afterstate(direction, board, score)
+        if board != None:
+            board, tile, _ = self.spawn(board)
+            score += self._spawn_score[tile]
+        return board, score
+
+    def afterstate(self, direction, board, score):
+        """
+        Immutable counterpart of get_afterstate.
+        """
+        vertical = direction == UP or direction == DOWN
+        reverse = direction == RIGHT or direction == DOWN
+        if vertical:
+            lines = zip(*board)
+        else:
+            lines = board
+
+        changed = False
+        merged_lines = []
+        for line in lines:
+            if reverse:
+                line = line[::-1]
+            merged, sum_score = self.merge(line)
+            score += sum_score
+            if reverse:
+                merged.reverse()
+                line = line[::-1]
+            merged = tuple(merged)
+            if merged != line:
+                changed = True
+            merged_lines.append(merged)
+
+        if not changed:
+            return None, score
+        if vertical:
+            return tuple(zip(*merged_lines)), score
+        return tuple(merged_lines), score
+
+    def simulate_move(self, direction, grid, score):
+        """
+        Move all tiles of the grid in the given direction. Returns
+        the grid (None if no tiles moved), the score and the cells
+        left empty.
+        """
         steps = self._height
         changed = False
         if direction == RIGHT or direction == LEFT:
             steps = self._width
+        empty = []
         for index in self._borders[direction]:
             cutted = self.simulate_cut(index, OFFSETS[direction], steps, grid)
             merged, sum_score = self.merge(cutted)
-            score = self.update_score(score, sum_score)
+            score += sum_score
             if cutted != merged:
                 changed = True
-            self.simulate_modify(index, OFFSETS[direction], steps, merged, grid)
-            
-            # self.alert("Move completed.")
-        
-        if changed:
-            # self.alert("The board changed!")
+            empty.extend(self.simulate_modify(index, OFFSETS[direction], steps, merged, grid))
 
-            self.simulate_new_tile(grid)
-
-            # self.alert("A new tile was added.")
-
-        else:
-            # self.alert("The board did not change.")
-            # print "BOARD DID NOT CHANGE"
+        if not changed:
             grid = None
 
-        return grid, score
+        return grid, score, empty
 
     def get_state(self):
         return self._grid
 
+    def from_grid(self, grid):
+        """
+        Convert a list-of-lists grid into an immutable board,
+        a tuple of row tuples, for successor and afterstate.
+        """
+        return tuple(tuple(row) for row in grid)
+
+    def to_grid(self, board):
+        """
+        Convert a board into a grid of tile values. Boards are
+        indexed like grids, so they can be read as they are.
+        """
+        return board
+
+    def canonical(self, board):
+        """
+        Canonical board of the symmetry class of a board, and the permutation
+        mapping its moves to moves on the canonical board (see symmetry.py).
+        """
+        return symmetry.canonical(board)
+
     def get_score(self):
         return self._score
 
@@ -217,24 +307,6 @@ class TwentyFortyEight:
     def get_tile_value(self, tile):
         return tile
 
-    def update_score(self, starting_score, added_score):
-        new_score = starting_score
-        if self._scoring == 0:
-            new_score += added_score
-        if self._scoring == 1:
-            new_score = 0
-            for row in self._grid:
-                for tile in row:
-                    new_score += self.get_tile_value(tile)        
-        if self._scoring == 2:
-            new_score = 0
-            for row in self._grid:
-                for tile in row:
-                    tile_value = self.get_tile_value(tile)
-                    if tile_value > 0:
-                        new_score += int(math.log(tile_value, 2))
-        return new_score
-
     def direction_quick(self, grid, direction):
         steps = self._height
 
@@ -298,6 +370,36 @@ class TwentyFortyEight:
 
     # Can probably make more efficient by first checking for empty tiles...
     def legal_moves(self, grid):
+        # The game's own grid is asked every turn (and again when printing),
+        # so its answer is cached along with a snapshot of the grid: any
+        # change to the grid, including through the list returned by
+        # get_state(), is seen by comparing snapshots. Callers get a copy
+        # of the cached moves.
+        if grid is self._grid:
+            snapshot = tuple(map(tuple, grid))
+            if self._legal is None or self._legal[0] != snapshot:
+                self._legal = (snapshot, self.compute_legal_moves(grid))
+            legal = self._legal[1]
+            if legal is None:
+                return None
+            return list(legal)
+        return self.compute_legal_moves(grid)
+
+    def rollout(self, board, score, depth=None):
+        """
+        Plays uniformly random legal moves from `board` (see from_grid)
+        until the game is over, or for at most `depth` moves. Returns the
+        final board, the score and the number of moves played.
+        """
+        moves = 0
+        legal = self.legal_moves(board)
+        while legal and moves != depth:
+            board, score = self.successor(random.choice(legal), board, score)
+            moves += 1
+            legal = self.legal_moves(board)
+        return board, score, moves
+
+    def compute_legal_moves(self, grid):
         legal = []
 
         vertical = self.direction_quick(grid, UP)
@@ -316,37 +418,69 @@ class TwentyFortyEight:
         square.  The tile should be 2 90% of the time and
         4 10% of the time.
         """
-        flg = True
-        col = 0
-        row = 0
-        while flg :
-            col = random.randrange(self._width)
-            row = random.randrange(self._height)
-            if self._grid[row][col] == 0 :
-                flg = False
-        if random.random() <= .1 :
-            self._grid[row][col] = 4
-        else:
-            self._grid[row][col] = 2
+        tile = self.simulate_new_tile(self._grid, self._empty)
+        if tile is not None:
+            self._score += self._spawn_score[tile]
 
-    def simulate_new_tile(self, grid):
+    def simulate_new_tile(self, grid, empty=None):
         """
         Create a new tile in a randomly selected empty
         square.  The tile should be 2 90% of the time and
-        4 10% of the time.
+        4 10% of the time. `empty` lists the empty cells of
+        the grid if the caller knows them (it is updated);
+        otherwise the grid is scanned. Returns the new tile, or
+        None on a full grid.
         """
-        flg = True
-        col = 0
-        row = 0
-        while flg :
-            col = random.randrange(self._width)
-            row = random.randrange(self._height)
-            if grid[row][col] == 0 :
-                flg = False
+        if empty is None:
+            empty = self.empty_cells(grid)
+        if empty == []:
+            return None
+        index = random.randrange(len(empty))
+        row, col = empty[index]
+        empty[index] = empty[-1]
+        empty.pop()
         if random.random() <= .1 :
             grid[row][col] = 4
         else:
             grid[row][col] = 2
+        return grid[row][col]
+
+    def empty_cells(self, grid):
+        """
+        Return the (row, col) positions of the empty cells of the grid.
+        """
+        return [(row, col) for row in range(self._height)
+                for col in range(self._width) if grid[row][col] == 0]
+    
+    def sample_spawn(self, board):
+        """
+        Return a new board with a tile added to the given board
+        as in simulate_new_tile, and the probability of that outcome.
+        """
+        board, _, probability = self.spawn(board)
+        return board, probability
+
+    def spawn(self, board):
+        """
+        sample_spawn, also returning the new tile: (board, tile, probability)
+        """
+        empty = self.empty_cells(board)
+        row, col = random.choice(empty)
+        if random.random() <= .1 :
+            tile = 4
+            probability = .1
+        else:
+            tile = 2
+            probability = .9
+        new_row = board[row][:col] + (tile,) + board[row][col+1:]
+        return board[:row] + (new_row,) + board[row+1:], tile, probability / len(empty)
+
+    def spawn_score(self, afterstate, board):
+        """
+        Score change of the new tile that turned `afterstate` into `board`.
+        """
+        tile = sum(map(sum, board)) - sum(map(sum, afterstate))
+        return self._spawn_score[tile]
     
     def board_print(self):
         if EVERY_MOVE == 0:
@@ -367,7 +501,7 @@ class TwentyFortyEight:
         self.stdscr.refresh()
 
     def simple_print(self):
-        print "\nScore: "+str(self.update_score(self._score, 0))
+        print "\nScore: "+str(self._score)
         table = self.pretty_grid_print()
         print '\n'.join(table)
 
@@ -390,7 +524,12 @@ class TwentyFortyEight:
         """
         Set the tile at position row, col to have the given value.
         """
+        was_empty = self._grid[row][col] == 0
         self._grid[row][col] = value
+        if was_empty and value != 0:
+            self._empty.remove((row, col))
+        elif not was_empty and value == 0:
+            self._empty.append((row, col))
 
     def get_tile(self, row, col):
         """
@@ -0,0 +1,61 @@
+"""
+Table-driven version of MCTS.heuristic for 4x4 boards
+
+Summed over its four corners, MCTS.heuristic adds, for every cell (i, j)
+with i, j < 3:
+    - 4 * EMPTYCONSTANT if the cell is empty,
+    - 2 * |log_2 difference| with its right neighbour,
+    - 2 * |log_2 difference| with the neighbour below,
+all scaled by HEURISTICCONSTANT. That splits into a per-row term over the
+top three rows and a per-column term over the left three columns, so both
+are precomputed for every packed 16-bit line of log_2 exponents and a board
+evaluates in six lookups (see bitboard.py for the packing).
+tests/test_heuristic_table.py checks it against MCTS.heuristic.
+"""
+import bitboard
+from constants import *
+
+# Empty cells (first three) and horizontal differences of a top-three row
+ROW_HEURISTIC = [0] * 65536
+# Vertical differences of a left-three column
+COLUMN_HEURISTIC = [0] * 65536
+
+
+def _build_tables():
+    for line in range(65536):
+        exponents = [(line >> (4 * i)) & 0xF for i in range(4)]
+        differences = sum(abs(exponents[i] - exponents[i+1]) for i in range(3))
+        empties = exponents[:3].count(0)
+        ROW_HEURISTIC[line] = 4 * EMPTYCONSTANT * empties + 2 * differences
+        COLUMN_HEURISTIC[line] = 2 * differences
+
+_build_tables()
+
+
+def evaluate_unscaled(board):
+    """
+    MCTS.heuristic of a packed board before scaling by HEURISTICCONSTANT.
+    """
+    mask = bitboard.ROW_MASK
+    columns = bitboard.transpose(board)
+    return (ROW_HEURISTIC[board & mask] + ROW_HEURISTIC[(board >> 16) & mask] +
+            ROW_HEURISTIC[(board >> 32) & mask] +
+            COLUMN_HEURISTIC[columns & mask] + COLUMN_HEURISTIC[(columns >> 16) & mask] +
+            COLUMN_HEURISTIC[(columns >> 32) & mask])
+
+
+def evaluate(board):
+    """
+    MCTS.heuristic of a packed board.
+    """
+    return HEURISTICCONSTANT * evaluate_unscaled(board)
+
+
+def evaluate_grid(grid):
+    """
+    MCTS.heuristic of a 4x4 grid of tile values. Raises ValueError for other
+    grids, and for tiles above 2^15, which the tables cannot index (see
+    bitboard.from_grid).
+    """
+    return evaluate(bitboard.from_grid(grid))
+
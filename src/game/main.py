@@ -3,12 +3,20 @@ import sys, termios, tty
 import random
 import time
 import MCTS
+import batch
+import bitboard
+import expectimax
 import numpy as np
 import copy
 import math
 import csv
 import datetime
 import getopt
+import multiprocessing
+import threading
+import budget
+import profiler
+import book
 from constants import *
 
 class _Getch:
@@ -83,7 +91,21 @@ def debug_print(string, force=False):
     if DEBUG == 1 or force:
         print string
 
+"""
+    Whether the strategies without a search play on bitboards: with BITBOARD,
+    on 4x4 boards, and unless every move is displayed, which the list engine
+    does
+"""
+def plays_on_bitboards(height, width):
+    return BITBOARD and height == 4 and width == 4 and EVERY_MOVE == -1
+
 def random_play(height, width, scoring):
+    if plays_on_bitboards(height, width):
+        engine = bitboard.Bitboard(scoring)
+        board, score = engine.start()
+        board, score, _ = engine.rollout(board, score)
+        return score, bitboard.highest_tile(board)
+
     play = TwentyFortyEight(height, width, scoring)
 
     end = False
@@ -108,56 +130,412 @@ def random_play(height, width, scoring):
     return final_score, highest
 
 """
-    Flat UCB
+    High level of Upper Confidence Bound for Trees (UCT) planning for one move.
+    If a worker `pool` is given, the move is planned with root parallelization.
+    If `root` is given, searching continues in that tree, which must be rooted
+    at the current state. A profiler.MoveProfile `profile` is filled in by the
+    serial search. `seconds` overrides TIMELIMIT when USETIMELIMIT is set.
+    The iterations of the serial search are added to info["iterations"] if
+    an `info` dict is given.
 """
-def mcts_simple(game):
-    root = MCTS.UctTree(game, game.get_state())
+def mcts(game, pool=None, root=None, profile=None, seconds=None, info=None):
+    
+    grid = game.get_state()
+    state = MCTS.game.from_grid(grid)
 
-    # for _ in range(ITERATIONS):
-    start = time.clock()
-    while (time.clock() - start < TIMELIMIT):
-        simulationNode, path = root.select()
-        
-        score = simulationNode.simulate()
-        
-        simulationNode.backPropagate(score, path)
+    # (0) look the position up in the opening book, and play from it if the
+    #     book is confident enough
+    opening = None
+    entry = None
+    if in_book(grid):
+        opening = get_book()
+        entry = opening.lookup(grid)
+        if entry is not None and BOOKCONFIDENCE is not None and entry.simulations() >= BOOKCONFIDENCE:
+            opening.record(grid, [0, 0, 0, 0], [0, 0, 0, 0], hits=1)
+            if info is not None:
+                info["book moves"] = info.get("book moves", 0) + 1
+            return entry.best()
 
-    # return the direction of the child of root with the highest average value
-    return root.evaluate()
+    if pool is not None:
+        root = mcts_root_parallel(state, pool, seconds)
+        if opening is not None:
+            record_root(opening, grid, root, ([0] * 4, [0] * 4), entry is not None)
+        return root.evaluate()
 
-"""
-    High level of Upper Confidence Bound for Trees (UCT) planning for one move
-"""
-def mcts(game):
-    
-    # (1) create root node with start state
-    root = MCTS.UctTree(game.get_state())
+    # (1) create root node with start state, warm-started from the book
+    if root is None:
+        root = make_root(state)
+    if opening is not None:
+        if entry is not None:
+            warm_start(root, entry)
+        before = root_stats(root)
 
     # (2) Repeatedly expand and search state tree based on samples. Repeat while
     # within our computational budget (iterations)
-    start = time.clock()
-    
-    if USETIMELIMIT:
-        ctr = 0
-        while ((time.clock() - start) < TIMELIMIT):
-            mcts_helper(root,ctr)
-            ctr += 1
-    else:
-        for ctr in range(ITERATIONS):
-            mcts_helper(root,ctr)   
+    iterations = search(root, ITERATIONS, profile, seconds)
+    if info is not None:
+        info["iterations"] = info.get("iterations", 0) + iterations
+
+    if root.table is not None:
+        debug_print(root.table.report())
+
+    if opening is not None:
+        record_root(opening, grid, root, before, entry is not None)
 
     # (3) After compuational budget exceeded, halt planning and conduct the action
     #     leading to the node with the highest value
     return root.evaluate()
 
-def mcts_helper(root,ctr):
+"""
+    Opening book of OPENINGBOOK, opened on first use and shared by the games
+    of this process
+"""
+shared_book = None
+
+def get_book():
+    global shared_book
+    if shared_book is None:
+        shared_book = book.Book(OPENINGBOOK, BOOKSIZE)
+    return shared_book
+
+"""
+    Whether the opening book covers `grid`: a 4x4 position whose tiles sum to
+    at most BOOKTILESUM
+"""
+def in_book(grid):
+    if OPENINGBOOK is None or len(grid) != 4 or len(grid[0]) != 4:
+        return False
+    return sum(sum(row) for row in grid) <= BOOKTILESUM
+
+"""
+    Simulations and total value of the root children of each move, in
+    book.DIRECTIONS order
+"""
+def root_stats(root):
+    visits = [0] * 4
+    totals = [0] * 4
+    for child, move in zip(root.getExpandedChildren(), root.getChildMoves()):
+        i = book.DIRECTIONS.index(move)
+        visits[i] += child.getNumSimulations()
+        totals[i] += child.value
+    return visits, totals
+
+"""
+    Seeds the root children of a new search with the statistics of a book
+    entry, expanding every move first if the root has no children yet
+"""
+def warm_start(root, entry):
+    if root.getExpandedChildren() == []:
+        root.expand_all()
+    seeded = set()
+    for child, move in zip(root.getExpandedChildren(), root.getChildMoves()):
+        i = book.DIRECTIONS.index(move)
+        if i in seeded or entry.visits[i] == 0:
+            continue
+        seeded.add(i)
+        child.numSimulations += entry.visits[i]
+        child.value += entry.value[i] * entry.visits[i]
+        root.numSimulations += entry.visits[i]
+
+"""
+    Appends to the book what the search added to the root children since
+    `before`, the root_stats at its start. `hit` tells whether the search
+    used a book entry.
+"""
+def record_root(opening, grid, root, before, hit):
+    visits, totals = root_stats(root)
+    visits = [visits[i] - before[0][i] for i in range(4)]
+    values = [float(totals[i] - before[1][i]) / visits[i] if visits[i] > 0 else 0.0
+              for i in range(4)]
+    opening.record(grid, visits, values, hits=int(hit))
+
+"""
+    Root node for a search from `state`, with its own transposition table if enabled
+"""
+def make_root(state):
+    table = None
+    if TRANSPOSITIONS:
+        table = MCTS.TranspositionTable(TTSIZE)
+    if CHANCENODES:
+        return MCTS.ChanceUctTree(state, table=table)
+    return MCTS.UctTree(state, table=table)
+
+"""
+    Runs mcts_helper on `root` until the computational budget is spent: the
+    `iterations`, or with USETIMELIMIT `seconds` (TIMELIMIT by default) of
+    wall time, see budget.Deadline. Returns the number of iterations run.
+
+    With TREEMEMORY, the search stops adding nodes once the tree under `root`
+    and its transposition table would take more than TREEMEMORY MiB (see
+    MCTS.TreeMemory) and keeps simulating from the existing tree.
+"""
+def search(root, iterations, profile=None, seconds=None):
+    if TREETHREADS > 1:
+        return search_tree_parallel(root, iterations, seconds)
+
+    memory = None
+    if TREEMEMORY is not None:
+        memory = MCTS.TreeMemory(root, TREEMEMORY * 2 ** 20)
+
+    try:
+        if USETIMELIMIT:
+            if seconds is None:
+                seconds = TIMELIMIT
+            return budget.Deadline(seconds).run(lambda ctr: mcts_helper(root,ctr,profile,memory))
+        else:
+            for ctr in range(iterations):
+                mcts_helper(root,ctr,profile,memory)
+            return iterations
+    finally:
+        MCTS.Tree.frozen = False
+
+"""
+    Leaf parallelization: the boards and starting scores of `rollouts` batched
+    games from each of `children`, grouped by child, so the final scores of
+    batch_rollouts reshape to (len(children), rollouts). The afterstate of a
+    chance node gets its tile first: every rollout from a chance node starts
+    from a spawn child sampled by ChanceNode.sampleOutcome. Also returns, per
+    rollout, that spawn child (None for other children), to be credited with
+    the rollout by credit_outcomes.
+"""
+def leaf_batch(children, rollouts):
+    states = []
+    scores = []
+    outcomes = []
+    for child in children:
+        chance = isinstance(child, MCTS.ChanceNode)
+        for _ in range(rollouts):
+            start = child.sampleOutcome() if chance else child
+            states.append(start.state)
+            scores.append(start.score)
+            outcomes.append(start if chance else None)
+    return batch.to_exponents(states), np.array(scores, dtype=np.int64), outcomes
+
+"""
+    Credits every spawn child of leaf_batch with the value of its rollout,
+    since backpropagation stops at the chance node (see ChanceNode.simulate)
+"""
+def credit_outcomes(outcomes, values):
+    for outcome, value in zip(outcomes, values.tolist()):
+        if outcome is not None:
+            outcome.incNumSimulations()
+            outcome.addValue(value)
+
+# Rollout policies (see MCTS.ROLLOUTS) that batch_rollouts can play
+BATCHPOLICIES = ["uniform", "score", "truncated"]
+
+"""
+    Batched rollouts (batch.py) of the rollout policy of the search from
+    `boards`, an (N, 4, 4) exponent array, with starting `scores`. Returns
+    the value of every rollout and its number of moves. Batched games play
+    uniformly random legal moves, so only the policies of BATCHPOLICIES are
+    supported: "truncated" stops after MCTS.ROLLOUTDEPTH moves and adds the
+    rollout evaluator's value of the board reached.
+"""
+def batch_rollouts(boards, scores, rng=np.random):
+    policy = MCTS.rolloutPolicyName
+    if policy not in BATCHPOLICIES:
+        raise ValueError("rollout policy " + repr(policy) + " cannot be batched, use one of " +
+                         ", ".join(BATCHPOLICIES))
+    if policy != "truncated":
+        boards, values, lengths = batch.play(boards, scores, rng)
+        return values, lengths
+
+    boards, values, lengths = batch.play(boards, scores, rng, MCTS.ROLLOUTDEPTH)
+    states = batch.from_exponents(boards)
+    if not BITBOARD:
+        states = [MCTS.game.from_grid(bitboard.to_grid(state)) for state in states]
+    values = values + np.array([MCTS.rolloutEvaluator(state) for state in states])
+    return values, lengths
+
+"""
+    Rollouts of leaf_batch's `outcomes` for a policy batch_rollouts cannot
+    play: one simulate() per rollout, from the sampled spawn child of a
+    chance node, or from the child itself. Returns their values.
+"""
+def serial_rollouts(children, outcomes, rollouts):
+    values = []
+    for j, outcome in enumerate(outcomes):
+        start = outcome if outcome is not None else children[j // rollouts]
+        values.append(start.simulate())
+    return np.array(values)
+
+"""
+    Tree parallelization: `threads` threads search the tree under `root`
+    together until `iterations` iterations are done in total (or, with
+    USETIMELIMIT, until `seconds` have passed). Returns the number of
+    iterations run.
+
+    Selection, expansion and backpropagation hold a lock on the tree. Each
+    thread selects and expands TREEBATCH leaves in a row, adding VIRTUALLOSS
+    simulations of value 0 along the path to each so the following
+    selections (its own and the other threads') spread over different paths.
+    The rollouts of all the expanded children of those leaves then run
+    outside the lock as one batch_rollouts call (or with serial_rollouts,
+    for policies outside BATCHPOLICIES), before the virtual losses are
+    reverted and the results backpropagated. Profiling and TREEMEMORY are
+    not supported here. An exception in a thread stops the others, and is
+    raised again once they have all finished.
+
+    Threads only run concurrently while NumPy works on a batch without the
+    GIL, so any speedup depends on the batch size and on the number of
+    cores; measure it with benchmark.py (tree_parallel_*) before relying on
+    it.
+"""
+def search_tree_parallel(root, iterations, seconds=None, threads=TREETHREADS):
+    lock = threading.Lock()
+    deadline = None
+    if USETIMELIMIT:
+        deadline = budget.clock() + (TIMELIMIT if seconds is None else seconds)
+    done = [0]
+    errors = []
+
+    def spent():
+        if errors:
+            return True
+        if deadline is None:
+            return done[0] >= iterations
+        return budget.clock() >= deadline and done[0] > 0
+
+    def worker(seed):
+        try:
+            search(np.random.RandomState(seed))
+        except Exception:
+            errors.append(sys.exc_info())
+
+    def revert(leaves):
+        for path, leafChildren in leaves:
+            root.addVirtualLoss(-VIRTUALLOSS, path + leafChildren)
+
+    def search(rng):
+        batched = MCTS.rolloutPolicyName in BATCHPOLICIES
+        while True:
+            leaves = []
+            with lock:
+                try:
+                    while len(leaves) < TREEBATCH and not spent():
+                        done[0] += 1
+                        simulationNode, path = root.select()
+                        simulationNode.expand()
+                        children = list(simulationNode.getExpandedChildren())
+                        if children == []:
+                            if simulationNode is not root:
+                                simulationNode.backPropagate(simulationNode.simulate(), path)
+                            continue
+                        root.addVirtualLoss(VIRTUALLOSS, path + children)
+                        leaves.append((path, children))
+                    if leaves == []:
+                        return
+                    children = [child for _, leafChildren in leaves for child in leafChildren]
+                    boards, scores, outcomes = leaf_batch(children, LEAFROLLOUTS)
+                except Exception:
+                    revert(leaves)
+                    raise
+
+            try:
+                if batched:
+                    values, _ = batch_rollouts(boards, scores, rng)
+                else:
+                    values = serial_rollouts(children, outcomes, LEAFROLLOUTS)
+                batch_scores = values.reshape(len(children), LEAFROLLOUTS).sum(axis=1).tolist()
+            finally:
+                with lock:
+                    revert(leaves)
+
+            with lock:
+                credit_outcomes(outcomes, values)
+                j = 0
+                for path, leafChildren in leaves:
+                    for child in leafChildren:
+                        child.backPropagate(batch_scores[j], path + [child], LEAFROLLOUTS)
+                        j += 1
+
+    workers = [threading.Thread(target=worker, args=(random.getrandbits(32),))
+               for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if errors:
+        error_type, error, traceback = errors[0]
+        raise error_type, error, traceback
+    return done[0]
+
+"""
+    Tree reuse: after `action` was played from the root of `root` and a tile
+    spawned, returns the child subtree matching the new `state` so its
+    simulations carry over to the next move, or a fresh root if the spawn
+    was never explored.
+"""
+def next_root(root, action, state):
+    if root is not None:
+        child = root.findChild(action, state)
+        # with SYMMETRY, a shared node may hold a rotation of `state`, whose
+        # moves would not be the moves of the game
+        if child is not None and child.state == state:
+            return child
+    return make_root(state)
+
+"""
+    Root parallelization: every worker builds an independent tree from the same
+    state with its own seed, and the statistics of the root children are summed
+    per move into the returned root.
+"""
+def mcts_root_parallel(state, pool, seconds=None):
+    jobs = [(state, random.getrandbits(32), seconds) for _ in range(WORKERS)]
+    reports = pool.map(root_worker, jobs)
+    return MCTS.merge_roots(state, reports)
+
+"""
+    Entry point of a root-parallel worker process. Returns the statistics of
+    the root children as (move, state, value, numSimulations) tuples.
+"""
+def root_worker(job):
+    state, seed, seconds = job
+    random.seed(seed)
+    np.random.seed(seed)
+
+    root = make_root(state)
+    search(root, WORKERITERATIONS, seconds=seconds)
+
+    return [(move, child.state, child.value, child.getNumSimulations())
+            for child, move in zip(root.getExpandedChildren(), root.getChildMoves())]
+
+"""
+    Worker pool for root-parallel search, or None when searching serially
+"""
+def make_pool(workers=WORKERS):
+    if workers > 1:
+        return multiprocessing.Pool(workers)
+    return None
+
+"""
+    One iteration of the search from `root`. If a profiler.MoveProfile
+    `profile` is given, the time and calls of every phase, the depth of the
+    selected node and the rollout lengths are added to it. Once the
+    MCTS.TreeMemory `memory` is full, no node is allocated.
+"""
+def mcts_helper(root,ctr,profile=None,memory=None):
     debug_print(" ")
     debug_print("-------------------------------------------")
     debug_print("Iteration " + str(ctr+1) + " of " + str(ITERATIONS))
+
+    full = memory is not None and memory.full()
+    MCTS.Tree.frozen = full
     
+    if profile is not None:
+        profile.iterations += 1
+        mark = profiler.timer()
+
     # (A) use tree policy to select most urgent expandable node
     simulationNode, path = root.select()
     
+    if profile is not None:
+        now = profiler.timer()
+        profile.add("select", now - mark)
+        profile.depth(len(path))
+        mark = now
+
     if DEBUG == 1:
         for j,node in enumerate(path):
             debug_print("select chose" + str(node) + "at level " + str(j+1))
@@ -165,21 +543,62 @@ def mcts_helper(root,ctr):
     debug_print ("simulation node: " + str(simulationNode) + " at depth " + str(len(path)))
 
 
+    # (A') tree is full: simulate from the selected node, or its most urgent
+    # child, without expanding. Chance children are skipped since sampling a
+    # spawn may allocate a node.
+    if full:
+        children = simulationNode.getExpandedChildren()
+        if children != [] and not isinstance(children[0], MCTS.ChanceNode):
+            simulationNode = simulationNode.bestChild()
+            path = path + [simulationNode]
+        simulationNode.backPropagate(simulationNode.simulate(), path)
+        return
+
     # (B) expand selected node and retrieve its children
     simulationNode.expand()
     children = simulationNode.getExpandedChildren()
 
+    if profile is not None:
+        now = profiler.timer()
+        profile.add("expand", now - mark)
+        mark = now
+
     if children == []:
         debug_print("NO CHILDREN EXPANDED")
     debug_print("expanded nodes: " + str(children))
 
-    # (C) Simulate a game for each of those children
+    # (B') a node without children is a finished game: score it directly
+    if children == [] and simulationNode is not root:
+        simulationNode.backPropagate(simulationNode.simulate(), path)
+
+    # (C) Simulate LEAFROLLOUTS games for each of those children
+    if BATCHROLLOUTS and children != []:
+        boards, scores, outcomes = leaf_batch(children, LEAFROLLOUTS)
+        batch_scores, lengths = batch_rollouts(boards, scores)
+        credit_outcomes(outcomes, batch_scores)
+        if profile is not None:
+            profile.rollout_lengths.extend(lengths.tolist())
+            now = profiler.timer()
+            profile.add("simulate", now - mark, len(boards))
+            mark = now
+        batch_scores = batch_scores.reshape(len(children), LEAFROLLOUTS).sum(axis=1)
+
     for j,child in enumerate(children):
 
         debug_print("simulating from " + str(j+1) + "th expanded node")
         
-        # (i) Simulates game from child and retrieves final score
-        score = child.simulate()
+        # (i) Simulates games from child and retrieves the sum of their final scores
+        if BATCHROLLOUTS:
+            score = batch_scores[j].item()
+        else:
+            score = 0
+            for _ in range(LEAFROLLOUTS):
+                score += child.simulate()
+                if profile is not None:
+                    now = profiler.timer()
+                    profile.add("simulate", now - mark)
+                    profile.rollout_lengths.append(child.rolloutLength)
+                    mark = now
 
         debug_print("estimated score from " + str(j+1) + "th child:"+ str(score))
         
@@ -187,41 +606,114 @@ def mcts_helper(root,ctr):
 
         debug_print("propagating score through path: " + str(fullpath))
         
-        # (ii) back-propagate that final score into the value of all expanded nodes in the path to child
-        child.backPropagate(score, fullpath)
+        # (ii) back-propagate those games into the value of all expanded nodes in the path to child
+        child.backPropagate(score, fullpath, LEAFROLLOUTS)
+
+        if profile is not None:
+            now = profiler.timer()
+            profile.add("backPropagate", now - mark)
+            mark = now
 
 
 """
-    Repeatedly calls UCT implementation to determine each move
+    Repeatedly calls UCT implementation to determine each move. If an `info`
+    dict is given, it is filled with statistics about the game, such as the
+    number of serial search iterations (info["iterations"]) and the total
+    decision time (info["search time"]).
+
+    With REUSETREE, the subtree under each played move is kept for the next
+    move (serial search only) and the simulations it carried over are
+    recorded per move in info["carried"]. REUSETREE requires CHANCENODES.
+
+    With PROFILE, the serial search of every move is profiled and the
+    records (see profiler.MoveProfile.record) are stored in info["profile"].
+
+    With USETIMELIMIT and a TIMEBANK, the time of each move is drawn from a
+    budget.TimeBank for the whole game instead of being TIMELIMIT. The mean
+    and max decision time are stored in info["mean latency"] and
+    info["max latency"].
 """
-def mcts_play(height, width, scoring):
+def mcts_play(height, width, scoring, info=None, workers=WORKERS):
     # debug_print("playing with " + str(ITERATIONS) + " iterations", force=True)
+    if REUSETREE and not CHANCENODES:
+        raise ValueError("REUSETREE requires CHANCENODES")
     
     # Start a new game
     play = TwentyFortyEight(height, width, scoring)
 
+    # The same workers plan every move of the game
+    pool = make_pool(workers)
     
-    
+    # Tree from the previous move and the action played from it
+    root = None
+    action = None
+    carried = []
+    records = []
+    latencies = []
+
+    bank = None
+    if USETIMELIMIT and TIMEBANK is not None:
+        bank = budget.TimeBank()
+
     # Play until end of game
     counter = 1 
-    while True:
+    try:
+        while True:
+            
+            # Stop if end of game
+            grid = play.get_state()
+            moves = play.legal_moves(grid)
+            if moves == None:
+                break
         
-        # Stop if end of game
-        grid = copy.deepcopy(play.get_state()) 
-        moves = play.legal_moves(grid)
-        if moves == None:
-            break
-    
-        debug_print("*******************************\n"+ "Move #" + str(counter))
+            debug_print("*******************************\n"+ "Move #" + str(counter))
 
-        # choose next action using mcts
-        action = mcts(play)
-        
-        # execute chosen action
-        play.move(action)
+            seconds = None
+            if bank is not None:
+                seconds = bank.allocate(sum(row.count(0) for row in grid))
+
+            profile = None
+            if PROFILE and pool is None:
+                profile = profiler.MoveProfile(counter)
+                allocated = MCTS.Tree.allocated
+
+            # choose next action using mcts
+            start = budget.clock()
+            if REUSETREE and pool is None:
+                root = next_root(root, action, MCTS.game.from_grid(grid))
+                carried.append(root.getNumSimulations())
+                debug_print("simulations carried over: " + str(carried[-1]))
+                action = mcts(play, root=root, profile=profile, seconds=seconds, info=info)
+            else:
+                action = mcts(play, pool, profile=profile, seconds=seconds, info=info)
+            latencies.append(budget.clock() - start)
+            if bank is not None:
+                bank.charge(latencies[-1])
+
+            if profile is not None:
+                profile.finish(MCTS.Tree.allocated - allocated)
+                records.append(profile.record())
+            
+            # execute chosen action
+            play.move(action)
 
-        counter += 1
-        debug_print(" ")
+            counter += 1
+            debug_print(" ")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if info is not None:
+        info["moves"] = counter - 1
+        info["carried"] = carried
+        info["profile"] = records
+        info.setdefault("iterations", 0)
+        info.setdefault("book moves", 0)
+        info["search time"] = sum(latencies)
+        if latencies:
+            info["mean latency"] = sum(latencies) / len(latencies)
+            info["max latency"] = max(latencies)
 
     # Game's over dude
     final_score = play.get_score()
@@ -230,6 +722,18 @@ def mcts_play(height, width, scoring):
     return final_score, highest
 
 def corner_play(height, width, scoring):
+    if plays_on_bitboards(height, width):
+        engine = bitboard.Bitboard(scoring)
+        board, score = engine.start()
+        directions = bitboard.legal_directions(board)
+        while directions:
+            for action in MCTS.CORNER_ORDER:
+                if action in directions:
+                    break
+            board, score = engine.successor(action, board, score)
+            directions = bitboard.legal_directions(board)
+        return score, bitboard.highest_tile(board)
+
     play = TwentyFortyEight(height, width, scoring)
 
     end = False
@@ -256,6 +760,38 @@ def corner_play(height, width, scoring):
     play.end_game()
     return final_score, highest
 
+"""
+    Plays with the expectimax agent. Runs on bitboards, so only 4 x 4 grids
+    are supported. If an `info` dict is given, it is filled with the number
+    of moves and the mean and max decision time.
+"""
+def expectimax_play(height, width, scoring, info=None):
+    play = TwentyFortyEight(height, width, scoring)
+
+    if EXPECTIMAXHEURISTIC:
+        agent = expectimax.Expectimax(evaluate=expectimax.evaluate_heuristic)
+    else:
+        agent = expectimax.Expectimax()
+
+    latencies = []
+    while True:
+        start = budget.clock()
+        action = agent.best_move(bitboard.from_grid(play.get_state()))
+        latencies.append(budget.clock() - start)
+        if action == None:
+            break
+        play.move(action)
+
+    if info is not None:
+        info["moves"] = len(latencies) - 1
+        info["mean latency"] = sum(latencies) / len(latencies)
+        info["max latency"] = max(latencies)
+
+    final_score = play.get_score()
+    highest = play.highest_tile()
+    play.end_game()
+    return final_score, highest
+
 def loop(height, width, strategy,scoring, n):
     scores = []
     highest = []
@@ -291,20 +827,36 @@ def usage():
     print "usage: python main.py strategy repititions"
     print "valid strategies: \"mcts\", \"corner\", \"random\", \"terminal\", \"simple\""
 
-def experiment1(filename, num_trials):
+STRATEGIES = {"mcts": mcts_play,
+              "expectimax": expectimax_play,
+              "corner": corner_play,
+              "random": random_play}
+
+def experiment1(filename, num_trials, strategy=mcts_play):
     scores = []
     highest = []
     fullfilename = filename + " " + str(datetime.datetime.now()) + ".csv"
     print "Experiment to file: " + fullfilename
+    profiling = PROFILE and strategy is mcts_play
+    if profiling:
+        profilefilename = fullfilename[:-len(".csv")] + " profile.jsonl"
+        print "Profile to file: " + profilefilename
     
     # run experiment
     for i in range(0,num_trials):
         
         print "Trial " + str(i+1)+ " of " + str(num_trials)
         
-        start = time.clock()
-        score, high = mcts_play(HEIGHT, WIDTH, SCORING)
-        end = time.clock()
+        start = budget.clock()
+        if profiling:
+            info = {}
+            score, high = strategy(HEIGHT, WIDTH, SCORING, info)
+        else:
+            score, high = strategy(HEIGHT, WIDTH, SCORING)
+        end = budget.clock()
+
+        if profiling:
+            profiler.write_records(profilefilename, info["profile"], trial=i+1)
         
         print "Score: " + str(score)
         print "High tile: " + str(high)
@@ -332,15 +884,161 @@ def experiment1(filename, num_trials):
             writer.writerow([score,highest[i]]) 
         writer.writerow(["average score", "highest tile"])
         writer.writerow([average_score, highest_tile])
+
+DEPTH_HEADER = ["rollout depth", "trials", "average score", "highest tile",
+                "average moves", "iterations", "iterations/sec"]
+
+"""
+    Playing strength against search speed of truncated rollouts. For each
+    rollout depth of `depths` (None for whole games), plays `num_trials`
+    mcts_play games with the "truncated" rollout policy and writes a row of
+    DEPTH_HEADER to `<filename>.csv`. Trial i of every depth is seeded with
+    `base_seed + i`. With USETIMELIMIT, shorter rollouts show up as more
+    iterations per move for the same TIMELIMIT.
+"""
+def depth_experiment(filename, num_trials, depths, base_seed=0):
+    fullfilename = filename + ".csv"
+    print "Experiment to file: " + fullfilename
+
+    MCTS.setRolloutPolicy("truncated")
+    with open(fullfilename, "ab") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(DEPTH_HEADER)
+
+        for depth in depths:
+            MCTS.setRolloutDepth(depth)
+            scores = []
+            highest = []
+            moves = 0
+            iterations = 0
+            search_time = 0.0
+            for i in range(num_trials):
+                random.seed(base_seed + i)
+                np.random.seed(base_seed + i)
+                info = {}
+                score, high = mcts_play(HEIGHT, WIDTH, SCORING, info)
+                scores.append(score)
+                highest.append(high)
+                moves += info["moves"]
+                iterations += info["iterations"]
+                search_time += info["search time"]
+
+            name = "full" if depth is None else depth
+            row = [name, num_trials, float(sum(scores)) / num_trials, max(highest),
+                   float(moves) / num_trials, iterations, iterations / search_time]
+            writer.writerow(row)
+            csvfile.flush()
+
+            print "Rollout depth " + str(name) + ": average score " + str(row[2]) + \
+                ", highest tile " + str(row[3]) + ", " + str(round(row[6], 1)) + " iterations/sec"
+
+TRIAL_HEADER = ["seed", "score", "high tile", "moves", "duration"]
+
+"""
+    Plays one mcts_play game seeded with `seed`. Returns a row of TRIAL_HEADER
+    and the profile records of the game (empty unless PROFILE is set).
+"""
+def play_trial(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+    info = {}
+    start = budget.clock()
+    # trial workers are daemonic and cannot open a root-parallel pool of their own
+    score, high = mcts_play(HEIGHT, WIDTH, SCORING, info, workers=1)
+    end = budget.clock()
+
+    return [seed, score, high, info["moves"], end - start], info["profile"]
+
+"""
+    Reads the trials already written to `fullfilename` and returns their rows.
+    A trailing row cut short by an interrupted run is removed from the file.
+"""
+def completed_trials(fullfilename):
+    try:
+        with open(fullfilename, "rb") as csvfile:
+            content = csvfile.read()
+    except IOError:
+        return []
+
+    if not content.endswith("\n"):
+        content = content[:content.rfind("\n") + 1]
+        with open(fullfilename, "wb") as csvfile:
+            csvfile.write(content)
+
+    rows = []
+    for row in csv.reader(content.splitlines()):
+        if row == TRIAL_HEADER or len(row) != len(TRIAL_HEADER):
+            continue
+        rows.append([int(row[0]), int(row[1]), int(row[2]), int(row[3]), float(row[4])])
+    return rows
+
+"""
+    Parallel version of experiment1. Trials are distributed over `processes`
+    worker processes, trial i is seeded with `base_seed + i`, and each row is
+    appended to the outfile as soon as its trial finishes. Rerunning with the
+    same outfile and seed resumes the experiment, skipping completed seeds.
+    With PROFILE, the per-move profiles go to `<outfile> profile.jsonl`.
+"""
+def experiment_parallel(filename, num_trials, processes, base_seed=0):
+    fullfilename = filename + ".csv"
+    profilefilename = filename + " profile.jsonl"
+    print "Experiment to file: " + fullfilename
+
+    rows = completed_trials(fullfilename)
+    done = set(row[0] for row in rows)
+    seeds = [base_seed + i for i in range(num_trials) if base_seed + i not in done]
+    if done:
+        print "Resuming: " + str(num_trials - len(seeds)) + " of " + str(num_trials) + " trials already completed"
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(fullfilename, "ab") as csvfile:
+            writer = csv.writer(csvfile)
+            if csvfile.tell() == 0:
+                writer.writerow(TRIAL_HEADER)
+                csvfile.flush()
+
+            for row, records in pool.imap_unordered(play_trial, seeds):
+                writer.writerow(row)
+                csvfile.flush()
+                rows.append(row)
+                if records:
+                    profiler.write_records(profilefilename, records, seed=row[0])
+
+                print "Trial with seed " + str(row[0]) + " (" + str(len(rows)) + " completed)"
+                print "Score: " + str(row[1])
+                print "High tile: " + str(row[2])
+                print "Duration: " + str(row[4]) + "s"
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if rows == []:
+        raise Exception("No games were played.")
+
+    # summarize results in terminal
+    scores_array = np.array([row[1] for row in rows])
+    print "Average score: " + str(scores_array.mean())
+    print "Highest tile: " + str(max(row[2] for row in rows)) + "\n"
     
 def usage():
-    print 'usage: main.py -n <num_trials> -f <outfile> -'
+    print 'usage: main.py -n <num_trials> -f <outfile> [-a <strategy>] [-p <processes>] [-s <seed>] [-r <rollout policy>]'
+    print '       main.py -n <num_trials> -f <outfile> -d <depth,depth,...> [-s <seed>]'
+    print 'rollout depths are numbers of moves, or "full" for whole games'
+    print 'valid strategies: ' + ', '.join(sorted(STRATEGIES)) + ' (-p supports mcts only)'
+    print 'valid rollout policies: ' + ', '.join('"' + name + '"' for name in sorted(MCTS.ROLLOUTS))
 
 def main(argv):
     filename = None
     num_trials = None
+    processes = None
+    base_seed = 0
+    strategy = mcts_play
+    depths = None
     try:
-        opts, args = getopt.getopt(argv,"n:f:")
+        opts, args = getopt.getopt(argv,"n:f:a:p:s:r:d:")
     except getopt.GetoptError:
         usage()
         sys.exit(2)
@@ -353,10 +1051,35 @@ def main(argv):
             num_trials = int(arg)
         elif opt == "-f":
             filename = arg
+        elif opt == "-a":
+            if arg not in STRATEGIES:
+                usage()
+                sys.exit(4)
+            strategy = STRATEGIES[arg]
+        elif opt == "-p":
+            processes = int(arg)
+        elif opt == "-s":
+            base_seed = int(arg)
+        elif opt == "-r":
+            if arg not in MCTS.ROLLOUTS:
+                usage()
+                sys.exit(4)
+            MCTS.setRolloutPolicy(arg)
+        elif opt == "-d":
+            depths = [None if depth == "full" else int(depth) for depth in arg.split(",")]
         else:
             usage()
             sys.exit(4)
-    experiment1(filename,num_trials)
+    if processes is not None and strategy is not mcts_play:
+        # parallel trials play mcts_play only
+        usage()
+        sys.exit(4)
+    if depths is not None:
+        depth_experiment(filename, num_trials, depths, base_seed)
+    elif processes is None:
+        experiment1(filename,num_trials,strategy)
+    else:
+        experiment_parallel(filename, num_trials, processes, base_seed)
 
 if __name__=='__main__':
     main(sys.argv[1:])
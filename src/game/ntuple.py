@@ -0,0 +1,297 @@
+"""
+N-tuple network evaluator
+
+Values an afterstate (a board after a move, before the spawn) by the
+expected score still to come. Each pattern is a tuple of cells, numbered
+4 * row + col; its table holds one weight per combination of tile exponents
+on those cells (16^len entries). The value of a board is the sum, over the
+eight symmetric images of the board (see symmetry.py) and every pattern, of
+the pattern's weight on the image, i.e. 8 * len(patterns) lookups. The rows
+of all images come from the rows and columns of the packed board
+(bitboard.py) and their reverses, and the cells of a pattern are read as
+runs of consecutive cells of a row. The default PATTERNS, two rows and three
+squares, have their own unrolled indexing.
+
+Weights are trained by TD(0) on afterstates over games of self-play
+(Szubert & Jaskowski, "Temporal difference learning of n-tuple networks for
+the game 2048"): the player picks the move maximizing gained score plus the
+value of the afterstate, and the value of each afterstate is moved towards
+the score gained by the next move plus the value of the next afterstate.
+
+File format: a 16-byte header (MAGIC, version, number of patterns), then for
+each pattern its length and its cells as bytes, padded to a multiple of 4
+bytes, then the float32 tables of all patterns, one after the other. Loaded
+networks map the tables into memory read-only.
+
+Train with
+
+    python ntuple.py -g <games> -o <weights> [-i <initial weights>] [-a <alpha>] [-s <seed>]
+"""
+import getopt
+import os
+import random
+import struct
+import sys
+import numpy as np
+import bitboard
+import scoring as scoring_schemes
+from constants import *
+
+MAGIC = "2048NTUP"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+
+# Outer row, inner row and three squares covering a corner, an edge and the
+# centre of the board
+PATTERNS = [(0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), (1, 2, 5, 6), (5, 6, 9, 10)]
+
+# Games between two progress reports while training
+REPORTEVERY = 100
+
+
+def images(board):
+    """
+    The rows (top to bottom, 16-bit) of the eight symmetric images of a
+    packed board, in symmetry.PERMUTATIONS order.
+    """
+    mask = bitboard.ROW_MASK
+    reverse = bitboard.ROW_REVERSE
+    r0, r1, r2, r3 = board & mask, (board >> 16) & mask, (board >> 32) & mask, board >> 48
+    columns = bitboard.transpose(board)
+    c0, c1, c2, c3 = columns & mask, (columns >> 16) & mask, (columns >> 32) & mask, columns >> 48
+    m0, m1, m2, m3 = reverse[r0], reverse[r1], reverse[r2], reverse[r3]
+    d0, d1, d2, d3 = reverse[c0], reverse[c1], reverse[c2], reverse[c3]
+    return ((r0, r1, r2, r3), (m0, m1, m2, m3), (r3, r2, r1, r0), (m3, m2, m1, m0),
+            (c0, c1, c2, c3), (c3, c2, c1, c0), (d0, d1, d2, d3), (d3, d2, d1, d0))
+
+
+def _runs(pattern):
+    """
+    Splits a pattern into runs of consecutive cells of a row, as
+    (row, shift of the run in the row, mask of the run, shift in the index).
+    """
+    runs = []
+    start = 0
+    for i in range(1, len(pattern) + 1):
+        if i == len(pattern) or pattern[i] != pattern[i - 1] + 1 or pattern[i] % 4 == 0:
+            length = i - start
+            runs.append((pattern[start] // 4, 4 * (pattern[start] % 4),
+                         (1 << (4 * length)) - 1, 4 * start))
+            start = i
+    return runs
+
+
+def _default_indices(board):
+    """
+    Network.indices for PATTERNS, unrolled.
+    """
+    indices = []
+    for a, b, c, _ in images(board):
+        indices += [a, 65536 + b, 131072 + ((a & 0xFF) | ((b & 0xFF) << 8)),
+                    196608 + (((a >> 4) & 0xFF) | (((b >> 4) & 0xFF) << 8)),
+                    262144 + (((b >> 4) & 0xFF) | (((c >> 4) & 0xFF) << 8))]
+    return indices
+
+
+class Network:
+    """
+    N-tuple network over `patterns`, with the concatenated tables of
+    `weights` (zeros by default).
+    """
+    def __init__(self, patterns=PATTERNS, weights=None):
+        self.patterns = [tuple(pattern) for pattern in patterns]
+        self.offsets = []
+        self.runs = []
+        size = 0
+        for pattern in self.patterns:
+            self.offsets.append(size)
+            self.runs.append(_runs(pattern))
+            size += 16 ** len(pattern)
+        if weights is None:
+            weights = np.zeros(size, dtype=np.float32)
+        if len(weights) != size:
+            raise ValueError("expected " + str(size) + " weights, got " + str(len(weights)))
+        self.weights = weights
+        self.layout = zip(self.offsets, self.runs)
+        self.lookups = 8 * len(self.patterns)
+        if self.patterns == PATTERNS:
+            self.indices = _default_indices
+
+    def indices(self, board):
+        """
+        Positions in `weights` of the weights read to evaluate `board`.
+        """
+        indices = []
+        for rows in images(board):
+            for offset, runs in self.layout:
+                index = offset
+                for row, shift, mask, destination in runs:
+                    index |= ((rows[row] >> shift) & mask) << destination
+                indices.append(index)
+        return indices
+
+    def evaluate(self, board):
+        """
+        Value of a packed board.
+        """
+        return sum(self.weights.take(self.indices(board)).tolist())
+
+    def update(self, board, delta):
+        """
+        Adds `delta` to every weight read by evaluate(board).
+        """
+        np.add.at(self.weights, self.indices(board), delta)
+
+    def save(self, path):
+        """
+        Writes the network to `path`, replacing any previous file atomically.
+        """
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as weightsfile:
+            weightsfile.write(HEADER.pack(MAGIC, VERSION, len(self.patterns)))
+            layout = ""
+            for pattern in self.patterns:
+                layout += struct.pack("<B", len(pattern)) + struct.pack("<" + str(len(pattern)) + "B", *pattern)
+            layout += "\0" * (-len(layout) % 4)
+            weightsfile.write(layout)
+            weightsfile.write(np.asarray(self.weights, dtype="<f4").tobytes())
+        os.rename(temporary, path)
+
+
+def load(path, writable=False):
+    """
+    Network stored at `path`. Its weights are memory mapped read-only, or
+    copied into memory if `writable` (to train them further).
+    """
+    with open(path, "rb") as weightsfile:
+        magic, version, count = HEADER.unpack(weightsfile.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + " is not an n-tuple network of version " + str(VERSION))
+        patterns = []
+        offset = HEADER.size
+        for _ in range(count):
+            length = struct.unpack("<B", weightsfile.read(1))[0]
+            patterns.append(struct.unpack("<" + str(length) + "B", weightsfile.read(length)))
+            offset += 1 + length
+    offset += -(offset - HEADER.size) % 4
+
+    size = sum(16 ** len(pattern) for pattern in patterns)
+    # a plain ndarray view of the mapping indexes faster than the memmap
+    weights = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(size,)).view(np.ndarray)
+    if writable:
+        weights = np.array(weights, dtype=np.float32)
+    return Network(patterns, weights)
+
+
+_default = None
+
+def default():
+    """
+    The network of NTUPLEWEIGHTS, loaded on first use.
+    """
+    global _default
+    if _default is None:
+        _default = load(NTUPLEWEIGHTS)
+    return _default
+
+
+"""
+    Training
+"""
+def best_afterstate(network, board, scores):
+    """
+    (afterstate, gained score) of the move maximizing gained score plus the
+    value of the afterstate, or (None, 0) if no move is legal.
+    """
+    best = None
+    best_gained = 0
+    best_value = None
+    for direction in bitboard.legal_directions(board):
+        moved, gained = bitboard.move(board, direction, scores)
+        value = gained + network.evaluate(moved)
+        if best_value is None or value > best_value:
+            best, best_gained, best_value = moved, gained, value
+    return best, best_gained
+
+
+def learn_game(network, alpha, scores):
+    """
+    Plays one game with the network's greedy policy, updating the value of
+    every afterstate by TD(0). Returns the final score.
+    """
+    board = bitboard.add_random_tile(bitboard.add_random_tile(0))
+    afterstate, gained = best_afterstate(network, board, scores)
+    score = gained
+    step = alpha / network.lookups
+    while afterstate is not None:
+        board = bitboard.add_random_tile(afterstate)
+        following, gained = best_afterstate(network, board, scores)
+        score += gained
+        target = 0.0
+        if following is not None:
+            target = gained + network.evaluate(following)
+        network.update(afterstate, step * (target - network.evaluate(afterstate)))
+        afterstate = following
+    return score
+
+
+def train(network, games, alpha=NTUPLEALPHA, scoring=SCORING):
+    """
+    Trains `network` (with writable weights) on `games` games of self-play,
+    printing the average score every REPORTEVERY games.
+    """
+    scores = bitboard.score_table(scoring_schemes.get(scoring))
+    recent = []
+    for played in range(1, games + 1):
+        recent.append(learn_game(network, alpha, scores))
+        if played % REPORTEVERY == 0 or played == games:
+            print "games " + str(played) + ": average score " + str(sum(recent) / len(recent))
+            recent = []
+
+
+def usage():
+    print 'usage: ntuple.py -g <games> -o <weights> [-i <initial weights>] [-a <alpha>] [-s <seed>]'
+
+
+def main_train(argv):
+    games = None
+    outfile = None
+    infile = None
+    alpha = NTUPLEALPHA
+    seed = None
+    try:
+        opts, args = getopt.getopt(argv, "g:o:i:a:s:h")
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-g":
+            games = int(arg)
+        elif opt == "-o":
+            outfile = arg
+        elif opt == "-i":
+            infile = arg
+        elif opt == "-a":
+            alpha = float(arg)
+        elif opt == "-s":
+            seed = int(arg)
+        else:
+            usage()
+            sys.exit(3)
+
+    if games is None or outfile is None:
+        usage()
+        sys.exit(2)
+
+    random.seed(seed)
+    if infile is None:
+        network = Network()
+    else:
+        network = load(infile, writable=True)
+    train(network, games, alpha)
+    network.save(outfile)
+
+
+if __name__ == '__main__':
+    main_train(sys.argv[1:])
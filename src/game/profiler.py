@@ -0,0 +1,70 @@
+"""
+Per-move profiling of the MCTS search
+
+A MoveProfile is handed to main.search for one move when PROFILE is set in
+constants.py. mcts_helper then accumulates the wall time and number of calls
+of each phase, the deepest selection path, and the length of every rollout.
+Without a profile, mcts_helper only pays for a few `is not None` checks.
+"""
+import json
+import budget
+
+PHASES = ["select", "expand", "simulate", "backPropagate"]
+
+timer = budget.clock
+
+
+class MoveProfile:
+    def __init__(self, move):
+        self.move = move
+        self.times = dict((phase, 0.0) for phase in PHASES)
+        self.calls = dict((phase, 0) for phase in PHASES)
+        self.iterations = 0
+        self.max_depth = 0
+        self.nodes = 0
+        self.rollout_lengths = []
+        self._started = timer()
+        self.duration = None
+
+    def add(self, phase, seconds, calls=1):
+        self.times[phase] += seconds
+        self.calls[phase] += calls
+
+    def depth(self, depth):
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def finish(self, nodes):
+        """
+        Closes the profile; `nodes` is the number of tree nodes allocated
+        during the move.
+        """
+        self.duration = timer() - self._started
+        self.nodes = nodes
+
+    def record(self):
+        """
+        The profile as a JSON-serializable dict.
+        """
+        lengths = self.rollout_lengths
+        return {"move": self.move,
+                "duration": self.duration,
+                "iterations": self.iterations,
+                "phases": dict((phase, {"time": self.times[phase], "calls": self.calls[phase]})
+                               for phase in PHASES),
+                "max depth": self.max_depth,
+                "nodes": self.nodes,
+                "rollouts": len(lengths),
+                "mean rollout length": float(sum(lengths)) / len(lengths) if lengths else None,
+                "max rollout length": max(lengths) if lengths else None}
+
+
+def write_records(filename, records, **fields):
+    """
+    Appends one JSON line per record to `filename`, adding `fields` (for
+    example the trial seed) to every record.
+    """
+    with open(filename, "a") as outfile:
+        for record in records:
+            record = dict(record, **fields)
+            outfile.write(json.dumps(record, sort_keys=True) + "\n")
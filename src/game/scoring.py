@@ -0,0 +1,72 @@
+"""
+Scoring schemes
+
+The score of a game only changes when tiles merge or a new tile spawns, so a
+scheme is defined by the score change of each event:
+    - merge(tile): two tiles of value `tile` merged into one of 2 * tile,
+    - spawn(tile): a new tile of value `tile` appeared.
+The engines (game.py, bitboard.py) apply these deltas as they move and spawn
+tiles, so scores are tracked incrementally, for the real game as well as for
+simulated boards.
+
+To add a scheme, subclass Scoring and register it in SCHEMES under the
+number used for SCORING in constants.py.
+"""
+
+
+class Scoring:
+    def merge(self, tile):
+        return 0
+
+    def spawn(self, tile):
+        return 0
+
+
+class Traditional(Scoring):
+    """
+    0 -> Traditional 2048 scoring, merges result in score of new tile added
+    """
+    def merge(self, tile):
+        return 2 * tile
+
+
+class TileSum(Scoring):
+    """
+    1 -> Score is the total sum of the tiles. Merges keep the sum, so only
+    spawns change it.
+    """
+    def spawn(self, tile):
+        return tile
+
+
+class LogSum(Scoring):
+    """
+    2 -> Score is the total sum of the log_2 value of the tiles. Two tiles of
+    exponent e become one of exponent e + 1, so merges lower the score by
+    e - 1.
+    """
+    def merge(self, tile):
+        return 1 - (tile.bit_length() - 1)
+
+    def spawn(self, tile):
+        return tile.bit_length() - 1
+
+
+SCHEMES = {0: Traditional,
+           1: TileSum,
+           2: LogSum}
+
+
+_instances = {}
+
+def get(scoring):
+    """
+    The Scoring instance for `scoring`, either a number of SCHEMES (the
+    same instance on every call) or already a Scoring instance. The engines
+    cache their score tables per instance, so schemes may take parameters.
+    """
+    if isinstance(scoring, Scoring):
+        return scoring
+    if scoring not in _instances:
+        _instances[scoring] = SCHEMES[scoring]()
+    return _instances[scoring]
@@ -0,0 +1,66 @@
+"""
+Board symmetries
+
+A square board has eight symmetries (rotations and reflections) that leave
+the game unchanged up to a relabelling of the moves: playing `move` on a
+board is the same as playing `permutation[move]` on its image. Every
+symmetry is a composition of
+    - MIRROR: reverse every row (left <-> right),
+    - FLIP: reverse the order of the rows (up <-> down),
+    - TRANSPOSE: swap rows and columns (up <-> left, down <-> right).
+
+The canonical board of a symmetry class is the smallest of its eight images,
+in the engine's own order (row tuples or packed integers).
+The engines (game.py, bitboard.py) offer `canonical(board)`, which returns
+the canonical board and the permutation mapping moves on `board` to moves on
+the canonical board, so caches can share one entry per symmetry class.
+"""
+from constants import *
+
+IDENTITY = {UP: UP, DOWN: DOWN, LEFT: LEFT, RIGHT: RIGHT}
+MIRROR = {UP: UP, DOWN: DOWN, LEFT: RIGHT, RIGHT: LEFT}
+FLIP = {UP: DOWN, DOWN: UP, LEFT: LEFT, RIGHT: RIGHT}
+TRANSPOSE = {UP: LEFT, DOWN: RIGHT, LEFT: UP, RIGHT: DOWN}
+
+
+def compose(*permutations):
+    """
+    Move permutation of the symmetries applied in the given order.
+    """
+    result = dict(IDENTITY)
+    for permutation in permutations:
+        result = dict((move, permutation[image]) for move, image in result.items())
+    return result
+
+
+def inverse(permutation):
+    return dict((image, move) for move, image in permutation.items())
+
+
+# Move permutations of the eight images, in the order the engines list them:
+# board, mirror, flip, mirror then flip, and the transposes of those four
+PERMUTATIONS = [IDENTITY, MIRROR, FLIP, compose(MIRROR, FLIP)]
+PERMUTATIONS += [compose(permutation, TRANSPOSE) for permutation in PERMUTATIONS]
+
+
+def images(board):
+    """
+    The images of a board of row tuples, in PERMUTATIONS order. Boards that
+    are not square have no transposed images.
+    """
+    mirrored = tuple(row[::-1] for row in board)
+    result = [board, mirrored, board[::-1], mirrored[::-1]]
+    if len(board) == len(board[0]):
+        result += [tuple(zip(*image)) for image in result]
+    return result
+
+
+def canonical(board):
+    """
+    Canonical board of a board of row tuples, and the permutation mapping
+    its moves to moves on the canonical board.
+    """
+    candidates = images(board)
+    best = min(range(len(candidates)), key=candidates.__getitem__)
+    return candidates[best], PERMUTATIONS[best]
+
@@ -0,0 +1,99 @@
+"""
+Tests of the batched rollouts against the bitboard engine
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import batch
+import bitboard
+import scoring
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+LOST = [[2, 4, 2, 4],
+        [4, 2, 4, 2],
+        [2, 4, 2, 4],
+        [4, 2, 4, 2]]
+
+
+def random_boards(count):
+    rng = random.Random(0)
+    grids = [[[rng.choice([0, 0, 0, 2, 4, 8, 16, 32]) for _ in range(4)] for _ in range(4)]
+             for _ in range(count)]
+    return [bitboard.from_grid(grid) for grid in grids + [START, LOST]]
+
+
+class BatchTest(unittest.TestCase):
+    def spawned(self, afterstate, board):
+        """
+        Whether `board` is `afterstate` with a 2 or a 4 on one empty cell.
+        """
+        cells = [cell for cell in range(0, 64, 4) if (board ^ afterstate) >> cell & 0xF]
+        return (len(cells) == 1 and afterstate >> cells[0] & 0xF == 0 and
+                board >> cells[0] & 0xF in (1, 2))
+
+    def test_step_matches_the_bitboard_engine(self):
+        boards = random_boards(300)
+        for scheme in sorted(scoring.SCHEMES):
+            engine = bitboard.Bitboard(scheme)
+            new_boards, gained, alive = batch.step(batch.to_exponents(boards),
+                                                   np.random.RandomState(scheme), scheme)
+            for board, new_board, score, live in zip(boards, batch.from_exponents(new_boards),
+                                                     gained, alive):
+                self.assertEqual(live, engine.legal_moves(board) is not None)
+                if not live:
+                    self.assertEqual(new_board, board)
+                    self.assertEqual(score, 0)
+                    continue
+                # some legal move followed by a spawn gives the board and score
+                outcomes = []
+                for direction in [UP, DOWN, LEFT, RIGHT]:
+                    afterstate, merged = engine.afterstate(direction, board, 0)
+                    if afterstate is not None and self.spawned(afterstate, new_board):
+                        outcomes.append(merged + engine.spawn_score(afterstate, new_board))
+                self.assertIn(score, outcomes)
+
+    def test_play_respects_the_depth(self):
+        boards = batch.to_exponents([bitboard.from_grid(START)] * 50)
+        rng = np.random.RandomState(0)
+        _, _, lengths = batch.play(boards, rng=rng, depth=5)
+        self.assertTrue((lengths == 5).all())
+        _, _, lengths = batch.play(boards, rng=rng)
+        self.assertTrue((lengths > 5).all())
+
+        # a lost board plays no move
+        _, scores, lengths = batch.play(batch.to_exponents([bitboard.from_grid(LOST)]),
+                                        scores=[7], rng=rng, depth=5)
+        self.assertEqual(lengths.tolist(), [0])
+        self.assertEqual(scores.tolist(), [7])
+
+    def test_simulate_plays_to_the_end(self):
+        boards = batch.to_exponents([bitboard.from_grid(START)] * 20)
+        scores, highest, lengths = batch.simulate(boards, scores=[10] * 20,
+                                                  rng=np.random.RandomState(0),
+                                                  return_lengths=True)
+        final_boards, final_scores, final_lengths = batch.play(boards, scores=[10] * 20,
+                                                               rng=np.random.RandomState(0))
+        self.assertEqual(scores.tolist(), final_scores.tolist())
+        self.assertEqual(lengths.tolist(), final_lengths.tolist())
+        for board, tile in zip(batch.from_exponents(final_boards), highest):
+            self.assertEqual(list(bitboard.legal_directions(board)), [])
+            self.assertEqual(tile, bitboard.highest_tile(board))
+
+
+if __name__ == '__main__':
+    unittest.main()
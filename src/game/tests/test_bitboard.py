@@ -0,0 +1,82 @@
+"""
+Tests of the bitboard engine against the list engine
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import batch
+import bitboard
+import main
+import MCTS
+import scoring
+from game import TwentyFortyEight
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+class BitboardTest(unittest.TestCase):
+    def test_transpose(self):
+        rng = random.Random(0)
+        for _ in range(1000):
+            grid = [[rng.choice([0] + [2 ** k for k in range(1, 16)]) for _ in range(4)]
+                    for _ in range(4)]
+            self.assertEqual(bitboard.to_grid(bitboard.transpose(bitboard.from_grid(grid))),
+                             [list(column) for column in zip(*grid)])
+
+    def test_rollout_plays_like_the_list_engine(self):
+        for scoring in [0, 1, 2]:
+            engines = TwentyFortyEight(4, 4, scoring), bitboard.Bitboard(scoring)
+            for depth in [None, 5]:
+                games = []
+                for engine in engines:
+                    random.seed(scoring)
+                    board, score, moves = engine.rollout(engine.from_grid(START), 10, depth)
+                    games.append(([list(row) for row in engine.to_grid(board)], score, moves))
+                self.assertEqual(games[0], games[1])
+
+    def test_score_tables_per_scheme_instance(self):
+        class Scaled(scoring.Scoring):
+            def __init__(self, factor):
+                self.factor = factor
+
+            def merge(self, tile):
+                return self.factor * tile
+
+        row = bitboard.from_grid([[2, 2, 0, 0]] + [[0] * 4] * 3)
+        self.assertEqual(bitboard.score_table(Scaled(1))[row], 2)
+        self.assertEqual(bitboard.score_table(Scaled(3))[row], 6)
+        self.assertEqual(batch.score_tables(Scaled(3))[0][row], 6)
+        self.assertIs(scoring.get(1), scoring.get(1))
+
+    def test_search_engine_follows_scoring(self):
+        self.assertIs(MCTS.game._scoring, scoring.get(SCORING))
+
+    def test_strategies_play_on_bitboards(self):
+        bitboards = main.BITBOARD
+        main.BITBOARD = True
+        try:
+            self.assertTrue(main.plays_on_bitboards(4, 4))
+            self.assertFalse(main.plays_on_bitboards(3, 4))
+            for strategy in [main.random_play, main.corner_play]:
+                random.seed(0)
+                score, highest = strategy(4, 4, 0)
+                self.assertGreater(score, 0)
+                self.assertGreaterEqual(highest, 16)
+        finally:
+            main.BITBOARD = bitboards
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests of the opening book
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import book
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+class BookTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "book")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record_and_lookup(self):
+        opening = book.Book(self.path, capacity=10)
+        self.assertIsNone(opening.lookup(START))
+        opening.record(START, [1, 2, 3, 4], [0.5, 1.5, 2.5, 3.5], hits=1)
+        opening.record(START, [1, 0, 1, 0], [1.5, 0.0, 0.5, 0.0])
+        for reopened in [opening, book.Book(self.path, capacity=10)]:
+            entry = reopened.lookup(START)
+            self.assertEqual(entry.hits, 1)
+            self.assertEqual(entry.visits, [2, 2, 4, 4])
+            self.assertEqual(entry.value, [1.0, 1.5, 2.0, 3.5])
+            # the mirror image shares the entry, with left and right swapped
+            entry = reopened.lookup([row[::-1] for row in START])
+            self.assertEqual(entry.visits, [2, 2, 4, 4])
+            self.assertEqual(entry.value, [1.0, 1.5, 3.5, 2.0])
+
+    def test_compaction_keeps_the_most_hit_boards(self):
+        opening = book.Book(self.path, capacity=2)
+        grids = [[[tile, 0, 0, 0]] + [[0] * 4] * 3 for tile in [2, 4, 8, 16, 32]]
+        for hits, grid in enumerate(grids):
+            opening.record(grid, [1, 1, 1, 1], [1.0, 1.0, 1.0, 1.0], hits=hits)
+        self.assertEqual(opening.records, 2)
+        self.assertEqual(len(opening.sorted), 2)
+        self.assertEqual(os.path.getsize(self.path), book.HEADER.size + 2 * book.RECORD.itemsize)
+        for grid in grids[:3]:
+            self.assertIsNone(opening.lookup(grid))
+        self.assertEqual(opening.lookup(grids[3]).hits, 3)
+        self.assertEqual(opening.lookup(grids[4]).hits, 4)
+
+    def test_reopens_after_a_truncated_record(self):
+        opening = book.Book(self.path, capacity=10)
+        grids = [[[tile, 0, 0, 0]] + [[0] * 4] * 3 for tile in [2, 4, 8]]
+        opening.record(grids[0], [1, 0, 0, 0], [1.0, 0.0, 0.0, 0.0])
+        opening.record(grids[1], [1, 0, 0, 0], [1.0, 0.0, 0.0, 0.0])
+        # an append interrupted halfway through its record
+        with open(self.path, "r+b") as bookfile:
+            bookfile.truncate(os.path.getsize(self.path) - book.RECORD.itemsize // 2)
+
+        reopened = book.Book(self.path, capacity=10)
+        self.assertEqual(reopened.records, 1)
+        self.assertIsNotNone(reopened.lookup(grids[0]))
+        self.assertIsNone(reopened.lookup(grids[1]))
+        # the next append drops the partial record
+        reopened.record(grids[2], [1, 0, 0, 0], [1.0, 0.0, 0.0, 0.0])
+        self.assertEqual(os.path.getsize(self.path), book.HEADER.size + 2 * book.RECORD.itemsize)
+        self.assertIsNotNone(book.Book(self.path, capacity=10).lookup(grids[2]))
+
+    def test_load_maps_the_file_it_read(self):
+        opening = book.Book(self.path, capacity=10)
+        for tile in [2, 4, 8]:
+            opening.record([[tile, 0, 0, 0]] + [[0] * 4] * 3, [1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0])
+
+        # a compaction by another process replaces the file with a shorter
+        # one between the header read and the mapping
+        memmap = book.np.memmap
+        def compacted(*args, **kwargs):
+            book.np.memmap = memmap
+            shorter = self.path + ".tmp"
+            with open(shorter, "wb") as bookfile:
+                bookfile.write(book.HEADER.pack(book.MAGIC, book.VERSION, 0))
+            os.rename(shorter, self.path)
+            return memmap(*args, **kwargs)
+        book.np.memmap = compacted
+        try:
+            reopened = book.Book(self.path, capacity=10)
+        finally:
+            book.np.memmap = memmap
+        self.assertEqual(reopened.records, 3)
+        self.assertIsNotNone(reopened.lookup([[8, 0, 0, 0]] + [[0] * 4] * 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests of the per-move deadline and the per-game time bank
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import budget
+
+
+class FakeClock:
+    """
+    Clock advanced by hand instead of by wall time.
+    """
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = budget.clock
+        budget.clock = FakeClock()
+
+    def tearDown(self):
+        budget.clock = self.clock
+
+    def test_stops_once_expired(self):
+        def iteration(counter):
+            budget.clock.now += 0.001
+        deadline = budget.Deadline(0.1)
+        iterations = deadline.run(iteration)
+        self.assertEqual(iterations, deadline.iterations)
+        self.assertGreaterEqual(deadline.elapsed, 0.1)
+        # batches shrink near the deadline: a few iterations of overshoot
+        self.assertLessEqual(deadline.elapsed, 0.1 + 0.005)
+        self.assertAlmostEqual(iterations * 0.001, deadline.elapsed)
+
+    def test_runs_one_iteration_without_time(self):
+        counters = []
+        def iteration(counter):
+            counters.append(counter)
+            budget.clock.now += 0.001
+        deadline = budget.Deadline(0)
+        self.assertEqual(deadline.run(iteration), 1)
+        # a second run continues counting
+        deadline.run(iteration)
+        self.assertEqual(counters, [0, 1])
+
+
+class TimeBankTest(unittest.TestCase):
+    def test_unspent_time_carries_over(self):
+        bank = budget.TimeBank(total=100.0, moves=100)
+        first = bank.allocate(16)
+        self.assertAlmostEqual(first, 1.0 * budget.criticality(16))
+        bank.charge(0.0)
+        # nothing spent: the next move of the same position gets more
+        second = bank.allocate(16)
+        self.assertGreater(second, first)
+        bank.charge(4 * second)
+        self.assertLess(bank.allocate(16), second)
+        self.assertAlmostEqual(bank.remaining, 100.0 - 4 * second)
+
+    def test_never_overdraws(self):
+        bank = budget.TimeBank(total=1.0, moves=10)
+        bank.charge(5.0)
+        self.assertEqual(bank.remaining, 0.0)
+        self.assertEqual(bank.allocate(0), 0.0)
+        bank = budget.TimeBank(total=1.0, moves=1)
+        self.assertLessEqual(bank.allocate(0), bank.remaining)
+
+    def test_critical_positions_get_more(self):
+        bank = budget.TimeBank(total=100.0, moves=100)
+        self.assertGreater(bank.allocate(1), bank.allocate(8))
+        self.assertGreater(bank.allocate(8), bank.allocate(16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests of the expectimax agent
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bitboard
+import budget
+import expectimax
+import heuristic_table
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+class ExpectimaxTest(unittest.TestCase):
+    def test_heuristic_is_unscaled(self):
+        board = bitboard.from_grid(START)
+        self.assertGreater(expectimax.evaluate_heuristic(board), 0)
+        self.assertEqual(expectimax.evaluate_heuristic(board), heuristic_table.evaluate_unscaled(board))
+
+    def test_cache_keeps_the_probability(self):
+        evaluated = []
+        def evaluate(board):
+            evaluated.append(board)
+            return expectimax.evaluate(board)
+        agent = expectimax.Expectimax(probability=0.01, time_limit=60, evaluate=evaluate)
+        agent._deadline = budget.clock() + 60
+        afterstate, _ = bitboard.move(bitboard.from_grid(START), LEFT)
+
+        agent._chance_node(afterstate, 3, 0.02)
+        coarse = len(evaluated)
+        # cut off more than a likelier branch would be: searched again
+        agent._chance_node(afterstate, 3, 1.0)
+        searched = len(evaluated)
+        self.assertGreater(searched, 2 * coarse)
+        # searched with no more cut off than a less likely branch: reused
+        agent._chance_node(afterstate, 3, 0.5)
+        self.assertEqual(len(evaluated), searched)
+
+    def test_negative_values(self):
+        # tiles of 2^13 and more make evaluate negative
+        board = bitboard.from_grid([[8192, 16384, 0, 0], [0] * 4, [0] * 4, [0] * 4])
+        moves = bitboard.legal_directions(board)
+        best = moves[-1]
+        afterstate, _ = bitboard.move(board, best)
+        def evaluate(board):
+            return -5 if board == afterstate else -10
+        agent = expectimax.Expectimax(depth=1, time_limit=60, evaluate=evaluate)
+        self.assertEqual(agent.best_move(board), best)
+
+        lost = bitboard.from_grid([[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 2]])
+        self.assertEqual(agent._max_node(lost, 1, 1.0), expectimax.LOST)
+        self.assertLess(expectimax.LOST, expectimax.evaluate(board))
+        self.assertLess(expectimax.LOST, expectimax.evaluate(0xFFFFFFFFFFFFFFFF))
+
+    def test_deadline(self):
+        agent = expectimax.Expectimax(depth=20, probability=0.0, time_limit=0.005)
+        board = bitboard.from_grid(START)
+        start = budget.clock()
+        self.assertIsNotNone(agent.best_move(board))
+        self.assertLess(agent.depth_reached, 20)
+        self.assertLess(budget.clock() - start, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
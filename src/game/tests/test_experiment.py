@@ -0,0 +1,55 @@
+"""
+Tests of the experiment runner of main.py
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import main
+
+
+class ExperimentTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "results.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resumes_from_a_partial_results_file(self):
+        self.assertEqual(main.completed_trials(self.path), [])
+        complete = ("seed,score,high tile,moves,duration\r\n"
+                    "3,1200,128,110,1.5\r\n"
+                    "1,2400,256,190,2.5\r\n")
+        with open(self.path, "wb") as csvfile:
+            # the last row was cut short by an interrupted run
+            csvfile.write(complete + "2,36")
+
+        self.assertEqual(main.completed_trials(self.path),
+                         [[3, 1200, 128, 110, 1.5], [1, 2400, 256, 190, 2.5]])
+        with open(self.path, "rb") as csvfile:
+            self.assertEqual(csvfile.read(), complete)
+
+    def test_parallel_trials_play_mcts_only(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            with self.assertRaises(SystemExit):
+                main.main(["-n", "1", "-f", os.path.join(self.directory, "results"),
+                           "-a", "random", "-p", "2"])
+        finally:
+            sys.stdout = stdout
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
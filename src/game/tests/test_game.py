@@ -0,0 +1,92 @@
+"""
+Tests of the list-based game engine
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from game import TwentyFortyEight
+from constants import *
+
+
+class LegalMovesTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.game = TwentyFortyEight(4, 4)
+
+    def fill(self, grid):
+        for row in range(4):
+            for col in range(4):
+                self.game.set_tile(row, col, grid[row][col])
+
+    def test_callers_get_a_copy(self):
+        self.fill([[2, 0, 0, 0]] + [[0] * 4] * 3)
+        grid = self.game.get_state()
+        moves = self.game.legal_moves(grid)
+        moves.remove(DOWN)
+        self.assertIn(DOWN, self.game.legal_moves(grid))
+
+    def test_sees_changes_through_get_state(self):
+        self.fill([[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 2]])
+        grid = self.game.get_state()
+        self.assertIsNone(self.game.legal_moves(grid))
+        grid[0][0] = 0
+        self.assertEqual(sorted(self.game.legal_moves(grid)), [UP, LEFT])
+
+
+class EmptyCellsTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.game = TwentyFortyEight(4, 4)
+
+    def check_empty(self):
+        self.assertEqual(sorted(self.game._empty),
+                         sorted(self.game.empty_cells(self.game.get_state())))
+
+    def test_tracked_through_a_game(self):
+        self.check_empty()
+        moves = 0
+        while self.game.legal_moves(self.game.get_state()) is not None:
+            board = self.game.from_grid(self.game.get_state())
+            direction = random.choice(self.game.legal_moves(self.game.get_state()))
+            afterstate, _ = self.game.afterstate(direction, board, 0)
+            self.game.move(direction)
+            self.check_empty()
+            # the spawn is the only difference with the afterstate, on one of its empty cells
+            grid = self.game.get_state()
+            changed = [(row, col) for row in range(4) for col in range(4)
+                       if grid[row][col] != afterstate[row][col]]
+            self.assertEqual(len(changed), 1)
+            row, col = changed[0]
+            self.assertEqual(afterstate[row][col], 0)
+            self.assertIn(grid[row][col], [2, 4])
+            moves += 1
+        self.assertGreater(moves, 20)
+
+    def test_tracked_through_set_tile(self):
+        self.game.set_tile(0, 0, 0)
+        self.game.set_tile(3, 3, 8)
+        self.game.set_tile(3, 3, 16)
+        self.check_empty()
+        for row in range(4):
+            for col in range(4):
+                self.game.set_tile(row, col, 2)
+        self.game.set_tile(1, 2, 0)
+        self.check_empty()
+        # the one empty cell is the only place a spawn can go
+        self.game.new_tile()
+        self.assertIn(self.game.get_tile(1, 2), [2, 4])
+        self.assertEqual(self.game._empty, [])
+        self.game.new_tile()
+        self.check_empty()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests of the table-driven heuristic against MCTS.heuristic
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bitboard
+import heuristic_table
+import MCTS
+
+
+def random_grid(rng):
+    return [[rng.choice([0, 0, 0] + [2 ** k for k in range(1, 16)]) for _ in range(4)]
+            for _ in range(4)]
+
+
+class HeuristicTableTest(unittest.TestCase):
+    def setUp(self):
+        # HEURISTICCONSTANT is 0 by default, which would make every value 0
+        self.constant = MCTS.HEURISTICCONSTANT
+        MCTS.HEURISTICCONSTANT = 3
+        heuristic_table.HEURISTICCONSTANT = 3
+
+    def tearDown(self):
+        MCTS.HEURISTICCONSTANT = self.constant
+        heuristic_table.HEURISTICCONSTANT = self.constant
+
+    def test_matches_heuristic(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            grid = random_grid(rng)
+            expected = MCTS.heuristic(grid)
+            self.assertAlmostEqual(heuristic_table.evaluate_grid(grid), expected)
+            self.assertAlmostEqual(heuristic_table.evaluate(bitboard.from_grid(grid)), expected)
+            self.assertAlmostEqual(3 * heuristic_table.evaluate_unscaled(bitboard.from_grid(grid)), expected)
+
+    def test_largest_tile(self):
+        grid = [[32768, 2, 0, 0], [4, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 32768]]
+        self.assertAlmostEqual(heuristic_table.evaluate_grid(grid), MCTS.heuristic(grid))
+
+    def test_rejects_boards_the_tables_do_not_fit(self):
+        with self.assertRaises(ValueError):
+            heuristic_table.evaluate_grid([[2, 0, 0], [0, 0, 0], [0, 0, 0]])
+        with self.assertRaises(ValueError):
+            heuristic_table.evaluate_grid([[2, 0, 0, 0, 0]] * 4)
+        with self.assertRaises(ValueError):
+            heuristic_table.evaluate_grid([[65536, 0, 0, 0]] + [[0] * 4] * 3)
+
+    @unittest.skipIf(MCTS.BITBOARD, "the search runs on 4x4 bitboards")
+    def test_other_sizes_use_the_heuristic(self):
+        grid = ((2, 4, 0), (0, 8, 2), (0, 0, 0))
+        self.assertEqual(MCTS.board_heuristic(grid), MCTS.heuristic(grid))
+
+
+class RolloutEvaluatorTest(unittest.TestCase):
+    def test_ignores_the_heuristic_weight(self):
+        # HEURISTICCONSTANT is 0 by default, the evaluator must not be
+        grid = [[2, 4, 8, 0], [0, 2, 0, 0], [0, 0, 2, 0], [0, 0, 0, 0]]
+        board = MCTS.game.from_grid(grid)
+        value = MCTS.EVALUATORS["heuristic"](board)
+        self.assertGreater(value, 0)
+        self.assertEqual(value, heuristic_table.evaluate_unscaled(bitboard.from_grid(grid)))
+        self.assertEqual(value, MCTS.unscaled_heuristic(grid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Tests of the n-tuple network evaluator
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bitboard
+import ntuple
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+def random_boards(count):
+    rng = random.Random(0)
+    return [bitboard.from_grid([[rng.choice([0, 0, 2, 4, 8, 16, 32, 64]) for _ in range(4)]
+                                for _ in range(4)])
+            for _ in range(count)]
+
+
+def random_network(patterns):
+    size = sum(16 ** len(pattern) for pattern in patterns)
+    return ntuple.Network(patterns, np.random.RandomState(0).rand(size).astype(np.float32))
+
+
+class NetworkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "weights")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_round_trip(self, network):
+        network.save(self.path)
+        for writable in [False, True]:
+            loaded = ntuple.load(self.path, writable)
+            self.assertEqual(loaded.patterns, network.patterns)
+            self.assertTrue((loaded.weights == network.weights).all())
+            self.assertEqual(loaded.weights.flags.writeable, writable)
+            for board in random_boards(100):
+                self.assertEqual(loaded.evaluate(board), network.evaluate(board))
+
+    def test_save_and_load(self):
+        self.check_round_trip(random_network(ntuple.PATTERNS))
+
+    def test_save_and_load_padded_patterns(self):
+        # pattern bytes that are not a multiple of 4 are padded in the file
+        self.check_round_trip(random_network([(0, 1, 2), (5, 9)]))
+
+    def test_default_indices(self):
+        network = random_network(ntuple.PATTERNS)
+        for board in random_boards(100):
+            self.assertEqual(network.indices(board), ntuple.Network.indices(network, board))
+
+    def test_update_moves_towards_the_target(self):
+        network = random_network(ntuple.PATTERNS)
+        step = 0.5 / network.lookups
+        for board in random_boards(20) + [bitboard.from_grid(START)]:
+            for target in [0.0, 1000.0]:
+                value = network.evaluate(board)
+                network.update(board, step * (target - value))
+                updated = network.evaluate(board)
+                self.assertLess(abs(target - updated), abs(target - value))
+
+
+if __name__ == '__main__':
+    unittest.main()
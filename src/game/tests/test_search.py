@@ -0,0 +1,222 @@
+"""
+Tests of the MCTS tree policy and of main.search
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import MCTS
+import main
+import profiler
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+def tree_depth(root):
+    """
+    Number of moves on the longest path below `root`.
+    """
+    deepest = 0
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in node.getExpandedChildren())
+    return deepest
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        # short rollouts keep the searches fast
+        self.depth = MCTS.ROLLOUTDEPTH
+        MCTS.setRolloutPolicy("truncated")
+        MCTS.setRolloutDepth(5)
+
+    def tearDown(self):
+        MCTS.setRolloutPolicy(ROLLOUTPOLICY)
+        MCTS.setRolloutDepth(self.depth)
+
+    def check_selection(self, tree, iterations=2000):
+        """
+        Runs `iterations` select, expand and backPropagate steps (random
+        scores instead of rollouts) on a tree of class `tree`: every path is
+        a chain of parents and children reaching well below the root, and
+        bestChild agrees with upperConfidenceBound.
+        """
+        rng = random.Random(0)
+        root = tree(MCTS.game.from_grid(START))
+        deepest = 0
+        for _ in range(iterations):
+            node, path = root.select()
+            self.assertIs(path[0], root)
+            self.assertIs(path[-1], node)
+            for parent, child in zip(path, path[1:]):
+                self.assertIn(child, parent.getExpandedChildren())
+            deepest = max(deepest, len(path))
+
+            node.expand()
+            for child in node.getExpandedChildren():
+                child.backPropagate(rng.randint(0, 10000), path + [child])
+
+        # at least two moves below the root (with chance nodes, a chance node
+        # and a player node per move)
+        self.assertGreaterEqual(deepest, 5 if tree is MCTS.ChanceUctTree else 3)
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            children = node.getExpandedChildren()
+            stack.extend(children)
+            if children == [] or node.getNumSimulations() == 0:
+                continue
+            ucbs = [child.upperConfidenceBound(node.getNumSimulations()) for child in children]
+            best = node.bestChild().upperConfidenceBound(node.getNumSimulations())
+            self.assertAlmostEqual(best, max(ucbs), delta=1e-9 * abs(max(ucbs)))
+
+    def test_selection(self):
+        self.check_selection(MCTS.UctTree)
+        self.check_selection(MCTS.ChanceUctTree)
+
+    def test_search_descends(self):
+        root = MCTS.UctTree(MCTS.game.from_grid(START))
+        profile = profiler.MoveProfile(1)
+        main.search(root, 200, profile)
+        # the selected path holds the root and at least two moves below it
+        self.assertGreater(profile.max_depth, 2)
+        self.assertGreater(tree_depth(root), 1)
+        self.assertEqual(root.getUntried(), [])
+
+    def test_tree_parallel_search(self):
+        for tree, depth in [(MCTS.UctTree, 1), (MCTS.ChanceUctTree, 2)]:
+            root = tree(MCTS.game.from_grid(START))
+            self.assertEqual(main.search_tree_parallel(root, 200, threads=4), 200)
+            self.assertGreater(tree_depth(root), depth)
+            # every virtual loss was reverted
+            self.assertEqual(root.getNumSimulations(),
+                             sum(child.getNumSimulations() for child in root.getExpandedChildren()))
+
+    def test_tree_parallel_search_with_unbatched_policy(self):
+        MCTS.setRolloutPolicy("corner")
+        for tree in [MCTS.UctTree, MCTS.ChanceUctTree]:
+            root = tree(MCTS.game.from_grid(START))
+            self.assertEqual(main.search_tree_parallel(root, 40, threads=2), 40)
+            self.assertEqual(root.getNumSimulations(),
+                             sum(child.getNumSimulations() for child in root.getExpandedChildren()))
+            self.assertGreater(root.getValue(), 0)
+
+    def test_tree_parallel_search_raises_worker_errors(self):
+        def fail(children, outcomes, rollouts):
+            raise RuntimeError("rollout failed")
+        serial_rollouts = main.serial_rollouts
+        main.serial_rollouts = fail
+        MCTS.setRolloutPolicy("corner")
+        try:
+            root = MCTS.UctTree(MCTS.game.from_grid(START))
+            with self.assertRaises(RuntimeError):
+                main.search_tree_parallel(root, 40, threads=2)
+        finally:
+            main.serial_rollouts = serial_rollouts
+        # the virtual losses were reverted
+        self.assertEqual(root.getNumSimulations(), 0)
+
+    def test_batched_chance_rollouts_start_after_a_spawn(self):
+        root = MCTS.ChanceUctTree(MCTS.game.from_grid(START))
+        root.expand_all()
+        children = root.getExpandedChildren()
+        boards, scores, outcomes = main.leaf_batch(children, 3)
+        for j, outcome in enumerate(outcomes):
+            chance = children[j // 3]
+            self.assertIn(outcome, chance.getExpandedChildren())
+            # one more tile than the afterstate
+            self.assertEqual((boards[j] > 0).sum(),
+                             sum(1 for row in MCTS.game.to_grid(chance.state) for tile in row if tile) + 1)
+
+    def test_expansion_tries_every_move_once(self):
+        root = MCTS.UctTree(MCTS.game.from_grid(START))
+        legal = MCTS.game.legal_moves(root.state)
+        for _ in legal:
+            self.assertTrue(root.expandable())
+            root.expand()
+        self.assertFalse(root.expandable())
+        self.assertEqual(sorted(root.getChildMoves()),
+                         sorted(legal))
+
+    def test_next_root_reuses_the_matching_subtree(self):
+        chancenodes = main.CHANCENODES
+        main.CHANCENODES = True
+        try:
+            root = MCTS.ChanceUctTree(MCTS.game.from_grid(START))
+            main.search(root, 50)
+            chance = root.getExpandedChildren()[0]
+            action = root.getChildMoves()[0]
+            spawned = chance.getExpandedChildren()[0]
+            self.assertIs(main.next_root(root, action, spawned.state), spawned)
+            self.assertGreater(spawned.getNumSimulations(), 0)
+
+            # a spawn the search never explored starts a fresh tree
+            explored = set(child.state for child in chance.getExpandedChildren())
+            afterstate, _ = MCTS.game.afterstate(action, root.state, 0)
+            grid = [list(row) for row in MCTS.game.to_grid(afterstate)]
+            spawns = []
+            for i in range(4):
+                for j in range(4):
+                    for tile in [2, 4]:
+                        if grid[i][j] == 0:
+                            grid[i][j] = tile
+                            spawns.append(MCTS.game.from_grid(grid))
+                            grid[i][j] = 0
+            state = [spawn for spawn in spawns if spawn not in explored][0]
+            fresh = main.next_root(root, action, state)
+            self.assertNotIn(fresh, chance.getExpandedChildren())
+            self.assertEqual(fresh.state, state)
+            self.assertEqual(fresh.getNumSimulations(), 0)
+            self.assertIsInstance(fresh, MCTS.ChanceUctTree)
+            self.assertEqual(main.next_root(None, action, state).getNumSimulations(), 0)
+        finally:
+            main.CHANCENODES = chancenodes
+
+    def test_heuristic_rollout_returns_the_heuristic(self):
+        root = MCTS.UctTree(MCTS.game.from_grid(START))
+        self.assertGreater(root.simulate_heuristic(), 0)
+        self.assertGreater(root.rolloutLength, 0)
+        lost = MCTS.game.from_grid([[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 2]])
+        root = MCTS.UctTree(lost)
+        self.assertEqual(root.simulate_heuristic(), MCTS.heuristic_evaluate(lost))
+        self.assertEqual(root.rolloutLength, 0)
+
+
+class TranspositionTableTest(unittest.TestCase):
+    def test_shared_by_position(self):
+        table = MCTS.TranspositionTable(10)
+        board = MCTS.game.from_grid(START)
+        first = MCTS.UctTree(board, table=table)
+        second = MCTS.UctTree(board, table=table)
+        child = first.makeChild(board, UP, 0)
+        self.assertIs(second.makeChild(board, LEFT, 0), child)
+        self.assertIsNone(table.lookup(board, MCTS.CHANCE))
+
+    def test_evicts_least_recently_used(self):
+        table = MCTS.TranspositionTable(2)
+        table.store("a", MCTS.PLAYER, 1)
+        table.store("b", MCTS.PLAYER, 2)
+        table.lookup("a", MCTS.PLAYER)
+        table.store("c", MCTS.PLAYER, 3)
+        self.assertEqual(table.lookup("a", MCTS.PLAYER), 1)
+        self.assertIsNone(table.lookup("b", MCTS.PLAYER))
+        self.assertEqual(table.evictions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
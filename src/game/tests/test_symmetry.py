@@ -0,0 +1,131 @@
+"""
+Tests of the board symmetries and of the caches keyed by canonical boards
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bitboard
+import book
+import budget
+import expectimax
+import MCTS
+import symmetry
+from game import TwentyFortyEight
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+
+def random_grids(count):
+    rng = random.Random(0)
+    return [[[rng.choice([0, 0, 0, 2, 4, 8, 16, 32]) for _ in range(4)] for _ in range(4)]
+            for _ in range(count)]
+
+
+def rows(grid):
+    return tuple(tuple(row) for row in grid)
+
+
+class CanonicalTest(unittest.TestCase):
+    def check(self, engine):
+        """
+        All images of a board have the same canonical board, and the
+        canonical board and the permuted moves agree with the image given by
+        symmetry.images.
+        """
+        for grid in random_grids(500):
+            board = engine.from_grid(grid)
+            target, permutation = engine.canonical(board)
+            index = symmetry.PERMUTATIONS.index(permutation)
+            self.assertEqual(engine.from_grid(symmetry.images(rows(grid))[index]), target)
+            for image in symmetry.images(rows(grid)):
+                self.assertEqual(engine.canonical(engine.from_grid(image))[0], target)
+            for move in [UP, DOWN, LEFT, RIGHT]:
+                afterstate, _ = engine.afterstate(move, board, 0)
+                moved, _ = engine.afterstate(permutation[move], target, 0)
+                self.assertEqual(afterstate is None, moved is None)
+                if afterstate is not None:
+                    image = symmetry.images(rows(engine.to_grid(afterstate)))[index]
+                    self.assertEqual(engine.from_grid(image), moved)
+
+    def test_list_engine(self):
+        self.check(TwentyFortyEight(4, 4))
+
+    def test_bitboard_engine(self):
+        self.check(bitboard.Bitboard())
+
+    def test_engines_pick_an_image(self):
+        # each engine takes the smallest image in its own order (row tuples
+        # or packed integers), not necessarily the same one
+        for grid in random_grids(500):
+            image = rows(bitboard.to_grid(bitboard.canonical(bitboard.from_grid(grid))[0]))
+            self.assertIn(image, symmetry.images(rows(grid)))
+            self.assertEqual(symmetry.canonical(image)[0], symmetry.canonical(rows(grid))[0])
+
+
+class SharedKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.symmetry = MCTS.SYMMETRY, expectimax.SYMMETRY
+        MCTS.SYMMETRY = expectimax.SYMMETRY = True
+
+    def tearDown(self):
+        MCTS.SYMMETRY, expectimax.SYMMETRY = self.symmetry
+
+    def test_caches_use_the_canonical_board(self):
+        table = MCTS.TranspositionTable()
+        for grid in random_grids(100):
+            self.assertEqual(book.board_key(grid)[0], bitboard.canonical(bitboard.from_grid(grid))[0])
+            board = MCTS.game.from_grid(grid)
+            self.assertEqual(table.key(board, MCTS.PLAYER), (MCTS.game.canonical(board)[0], MCTS.PLAYER))
+
+    def test_transposition_table(self):
+        table = MCTS.TranspositionTable(10)
+        node = MCTS.UctTree(MCTS.game.from_grid(START))
+        table.store(node.state, MCTS.PLAYER, node)
+        for image in symmetry.images(rows(START)):
+            self.assertIs(table.lookup(MCTS.game.from_grid(image), MCTS.PLAYER), node)
+
+    def test_expectimax_cache(self):
+        evaluated = []
+        def evaluate(board):
+            evaluated.append(board)
+            return expectimax.evaluate(board)
+        agent = expectimax.Expectimax(probability=0.0, time_limit=60, evaluate=evaluate)
+        agent._deadline = budget.clock() + 60
+        afterstate, _ = bitboard.move(bitboard.from_grid(START), LEFT)
+        value = agent._chance_node(afterstate, 2, 1.0)
+        searched = len(evaluated)
+        for image in symmetry.images(rows(bitboard.to_grid(afterstate))):
+            self.assertEqual(agent._chance_node(bitboard.from_grid(image), 2, 1.0), value)
+        self.assertEqual(len(evaluated), searched)
+
+    def test_book(self):
+        directory = tempfile.mkdtemp()
+        try:
+            opening = book.Book(os.path.join(directory, "book"), capacity=10)
+            opening.record(START, [1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0])
+            for image, permutation in zip(symmetry.images(rows(START)), symmetry.PERMUTATIONS):
+                entry = opening.lookup([list(row) for row in image])
+                # a move on START is permutation[move] on its image
+                for i, move in enumerate(book.DIRECTIONS):
+                    j = book.DIRECTIONS.index(permutation[move])
+                    self.assertEqual(entry.visits[j], i + 1)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests of the TREEMEMORY cap of main.search
+
+Run from src/game with
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import MCTS
+import main
+from constants import *
+
+START = [[2, 4, 8, 0],
+         [0, 2, 0, 0],
+         [0, 0, 2, 0],
+         [0, 0, 0, 0]]
+
+# MiB
+CAP = 0.25
+
+
+def footprint(root):
+    """
+    Bytes held by the tree under `root` and its transposition table.
+    """
+    total = sum(MCTS.nodeFootprint(node) for node in MCTS.treeNodes(root))
+    if root.table is not None:
+        total += root.table.tableFootprint()
+    return total
+
+
+class TreeMemoryTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        # short rollouts let a search allocate many nodes quickly
+        self.depth = MCTS.ROLLOUTDEPTH
+        self.memory = main.TREEMEMORY
+        MCTS.setRolloutPolicy("truncated")
+        MCTS.setRolloutDepth(2)
+        main.TREEMEMORY = CAP
+
+    def tearDown(self):
+        MCTS.setRolloutPolicy(ROLLOUTPOLICY)
+        MCTS.setRolloutDepth(self.depth)
+        main.TREEMEMORY = self.memory
+
+    def check(self, root):
+        allocated = MCTS.Tree.allocated
+        main.search(root, 4000)
+        # the tree filled most of the cap, then stopped growing: an iteration
+        # allocates at least one node while the tree grows
+        self.assertLess(MCTS.Tree.allocated - allocated, 2000)
+        self.assertLessEqual(footprint(root), CAP * 2 ** 20)
+        self.assertGreater(footprint(root), CAP * 2 ** 20 / 2)
+        self.assertFalse(MCTS.Tree.frozen)
+        # a search of the full tree keeps it within the cap
+        main.search(root, 500)
+        self.assertLessEqual(footprint(root), CAP * 2 ** 20)
+
+    def test_player_nodes(self):
+        self.check(MCTS.UctTree(MCTS.game.from_grid(START)))
+
+    def test_chance_nodes_and_transpositions(self):
+        table = MCTS.TranspositionTable(TTSIZE)
+        self.check(MCTS.ChanceUctTree(MCTS.game.from_grid(START), table=table))
+
+
+if __name__ == '__main__':
+    unittest.main()